@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import Group, Post
+from .models import Group, Post, Task
+from .search import search_post_ids
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -9,6 +10,19 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ("pub_date",)
     empty_value_display = "-пусто-"
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по обратному индексу вместо LIKE по search_fields
+        if not search_term.strip():
+            return queryset, False
+        return queryset.filter(pk__in=search_post_ids(search_term)), False
+
+
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ("pk", "name", "status", "attempts", "run_at", "created")
+    list_filter = ("status", "name")
+    readonly_fields = ("created",)
+
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
+admin.site.register(Task, TaskAdmin)
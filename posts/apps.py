@@ -1,5 +1,13 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from yatube.db import configure_sqlite
+
+        from . import signals  # noqa: F401
+        connection_created.connect(configure_sqlite,
+                                   dispatch_uid='yatube.configure_sqlite')
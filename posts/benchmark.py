@@ -0,0 +1,68 @@
+"""
+Общие части команд замера производительности.
+
+Результаты benchmark_views дописываются строками JSON в
+BENCHMARK_RESULTS_FILE вместе с коммитом, на котором сделан замер, —
+так видно, в каком коммите страница стала медленнее.
+"""
+import json
+import os
+import subprocess
+
+from django.conf import settings
+from django.utils import timezone
+
+
+def percentile(timings, share):
+    """Значение, ниже которого доля share отсортированных замеров."""
+    if not timings:
+        return None
+    return timings[min(int(len(timings) * share), len(timings) - 1)]
+
+
+def summarize(timings, duration):
+    """Сводка по замерам в секундах: частота и перцентили в мс."""
+    timings = sorted(timings)
+    if not timings:
+        return {'count': 0}
+    return {
+        'count': len(timings),
+        'rps': round(len(timings) / duration, 1),
+        'mean_ms': round(sum(timings) / len(timings) * 1000, 2),
+        'p50_ms': round(percentile(timings, 0.5) * 1000, 2),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 2),
+    }
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_results(path=None):
+    path = path or settings.BENCHMARK_RESULTS_FILE
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as stream:
+        return [json.loads(line) for line in stream if line.strip()]
+
+
+def save_result(result, path=None):
+    """Дописывает замер с коммитом и временем; возвращает запись."""
+    path = path or settings.BENCHMARK_RESULTS_FILE
+    record = {
+        'commit': current_commit(),
+        'time': timezone.now().isoformat(),
+        **result,
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as stream:
+        stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+    return record
@@ -0,0 +1,226 @@
+"""
+Кэширование лент и карточек записей.
+
+Страницы лент хранятся под ключами, в которые входят номера поколений
+(generation) затронутых областей: общей ленты, сообщества и автора.
+Любое изменение записи увеличивает поколения своих областей, и старые
+страницы просто перестают быть свежими. Поэтому срок хранения может быть
+долгим, а новая запись видна сразу.
+
+Страница хранится вместе с поколениями, при которых она собрана
+(stale-while-revalidate). Когда поколение меняется, страницу
+пересобирает только тот запрос, который первым взял аренду на её ключ;
+остальные в это время получают прежнюю копию, а если копии нет — ждут
+новую до FEED_REBUILD_WAIT секунд. Так изменение записи в час пик не
+вызывает одновременную пересборку ленты всеми воркерами. Пользователю,
+который только что писал (yatube.routers.is_pinned), прежняя копия не
+показывается: он должен увидеть своё изменение.
+
+Поколения же служат валидатором ETag: если браузер или прокси прислал
+ETag страницы с текущими поколениями, ответ 304 отдаётся без обращения
+к кэшу страниц и без отрисовки.
+"""
+import hashlib
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from yatube.metrics import current_stats, registry
+from yatube.routers import is_pinned, use_primary
+
+POST_CARD_FRAGMENT = 'post_card'
+FEED_GENERATION_KEY = 'feed:generation:{}'
+FEED_PAGE_KEY = 'feed:page:{}'
+FEED_LEASE_KEY = 'feed:lease:{}'
+# Как часто ожидающий запрос проверяет, готова ли новая страница
+FEED_REBUILD_POLL = 0.05
+
+INDEX_SCOPE = 'index'
+
+
+def group_scope(slug):
+    return f'group:{slug}'
+
+
+def author_scope(username):
+    return f'author:{username}'
+
+
+def timeline_scope(user_id):
+    return f'timeline:{user_id}'
+
+
+def post_scopes(post):
+    """Области лент, в которых показывается запись."""
+    scopes = [INDEX_SCOPE, author_scope(post.author.username)]
+    if post.group_id is not None:
+        scopes.append(group_scope(post.group.slug))
+    return scopes
+
+
+def post_card_key(post):
+    """
+    Ключ кэша карточки записи, как его строит {% cache %}.
+
+    Версия меняется при сохранении записи, имя автора и сообщество — при
+    их переименовании, так что устаревшая карточка не будет найдена.
+    Время публикации отличает запись от удалённой с тем же id. Счётчик
+    комментариев в кэшируемую часть не входит.
+    """
+    group = post.group
+    return make_template_fragment_key(
+        POST_CARD_FRAGMENT,
+        [post.id, post.version, post.pub_date.timestamp(),
+         post.author.username,
+         group.slug if group else '', group.title if group else ''],
+    )
+
+
+def forget_post_card(post):
+    cache.delete(post_card_key(post))
+
+
+def _initial_generation():
+    # Поколение начинается с текущего времени: если счётчик вытеснят из
+    # кэша, новый не совпадёт ни с одним из прежних значений
+    return time.time_ns() // 1000
+
+
+def get_generations(scopes):
+    """Текущие поколения областей, по порядку scopes."""
+    keys = [FEED_GENERATION_KEY.format(scope) for scope in scopes]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, _initial_generation(), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def bump_generations(scopes):
+    """Делает устаревшими все закэшированные страницы областей."""
+    for scope in set(scopes):
+        key = FEED_GENERATION_KEY.format(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial_generation(), None)
+
+
+def feed_page_key(request):
+    viewer = request.user.pk if request.user.is_authenticated else 'anon'
+    raw = f'{request.get_full_path()}:{viewer}'
+    return FEED_PAGE_KEY.format(hashlib.md5(raw.encode()).hexdigest())
+
+
+def page_etag(request, *versions):
+    """
+    ETag страницы: адрес, зритель и версии показанных данных. Выпуск
+    (settings.RELEASE) входит в ETag, чтобы после выкладки страницы
+    прежних шаблонов не считались неизменными.
+    """
+    viewer = request.user.pk if request.user.is_authenticated else 'anon'
+    raw = (f'{request.get_full_path()}:{viewer}:{settings.RELEASE}:'
+           f'{versions}')
+    return f'"{hashlib.md5(raw.encode()).hexdigest()}"'
+
+
+def _count(request, result):
+    # Как и остальные метрики, считается только для замеряемых запросов
+    if current_stats() is not None:
+        match = request.resolver_match
+        registry.inc('yatube_feed_cache_total', {
+            'view': match.view_name if match else 'unresolved',
+            'result': result,
+        })
+
+
+def _rebuild(key, generations, render):
+    """Собирает страницу под арендой; None, если аренда занята."""
+    lease = FEED_LEASE_KEY.format(key)
+    token = uuid.uuid4().hex
+    if not cache.add(lease, token, settings.FEED_REBUILD_LEASE):
+        return None
+    try:
+        # Страница хранится долго: собираем её по основной базе, а не
+        # по отстающей реплике
+        with use_primary():
+            response = render()
+        if response.status_code == 200:
+            cache.set(key, (generations, response),
+                      settings.FEED_CACHE_TIMEOUT)
+    finally:
+        # Аренда могла истечь и достаться другому — его не снимаем
+        if cache.get(lease) == token:
+            cache.delete(lease)
+    return response
+
+
+def _wait_for(key, generations):
+    """Ждёт страницу, которую собирает другой запрос."""
+    deadline = time.monotonic() + settings.FEED_REBUILD_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(FEED_REBUILD_POLL)
+        entry = cache.get(key)
+        if entry is not None and entry[0] == generations:
+            return entry[1]
+    return None
+
+
+def cache_feed(scopes):
+    """
+    Кэширует страницу ленты до изменения её областей.
+
+    ``scopes(**kwargs)`` по аргументам представления возвращает список
+    областей. Страница хранится отдельно для каждого пользователя, так как
+    навигация и кнопки зависят от того, кто смотрит. На условный GET
+    с текущим ETag отвечает 304.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            def render():
+                return view(request, *args, **kwargs)
+
+            generations = get_generations(scopes(**kwargs))
+            etag = page_etag(request, generations)
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                not_modified['ETag'] = etag
+                patch_vary_headers(not_modified, ('Cookie',))
+                return not_modified
+            key = feed_page_key(request)
+            entry = cache.get(key)
+            served = generations
+            if entry is not None and entry[0] == generations:
+                _count(request, 'hit')
+                response = entry[1]
+            else:
+                response = _rebuild(key, generations, render)
+                if response is not None:
+                    _count(request, 'miss')
+                elif entry is not None and not is_pinned():
+                    _count(request, 'stale')
+                    # ETag прежней копии, чтобы следующий запрос её обновил
+                    served, response = entry
+                else:
+                    response = _wait_for(key, generations)
+                    if response is not None:
+                        _count(request, 'coalesced')
+                    else:
+                        # Не дождались: собираем сами, не сохраняя
+                        _count(request, 'miss')
+                        response = render()
+            if response.status_code == 200:
+                response['ETag'] = page_etag(request, served)
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return wrapper
+    return decorator
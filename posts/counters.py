@@ -0,0 +1,60 @@
+"""
+Денормализованные счётчики: записи, подписчики и подписки автора,
+комментарии к записи. Обновляются сигналами в той же транзакции,
+что и изменение данных, и пересчитываются командой recount_counters.
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import AuthorStats, Comment, Follow, Post, User
+
+
+def get_stats(user):
+    """Счётчики пользователя; строка создаётся при первом обращении."""
+    stats, _ = AuthorStats.objects.get_or_create(user=user)
+    return stats
+
+
+def change_stats(user_id, **deltas):
+    """Атомарно меняет счётчики пользователя на заданные величины."""
+    changes = {field: F(field) + delta for field, delta in deltas.items()}
+    updated = AuthorStats.objects.filter(user_id=user_id).update(**changes)
+    if not updated and all(delta > 0 for delta in deltas.values()):
+        # Строки ещё нет: создаём её и повторяем обновление, чтобы
+        # не потерять параллельное приращение
+        AuthorStats.objects.get_or_create(user_id=user_id)
+        AuthorStats.objects.filter(user_id=user_id).update(**changes)
+
+
+def change_comment_count(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comment_count=F('comment_count') + delta)
+
+
+def _count_of(queryset, field):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total')
+    ), 0)
+
+
+def recount_all():
+    """Пересчитывает все счётчики заново, исправляя расхождения."""
+    users = User.objects.exclude(stats__isnull=False).values_list(
+        'pk', flat=True)
+    AuthorStats.objects.bulk_create(
+        (AuthorStats(user_id=user_id) for user_id in users.iterator()),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    stats = AuthorStats.objects.update(
+        posts_count=_count_of(Post.objects.all(), 'author'),
+        followers_count=_count_of(Follow.objects.all(), 'author'),
+        following_count=_count_of(Follow.objects.all(), 'user'),
+    )
+    posts = Post.objects.update(
+        comment_count=_count_of(Comment.objects.all(), 'post'))
+    return stats, posts
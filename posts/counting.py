@@ -0,0 +1,50 @@
+"""
+Число записей в лентах для нумерованной навигации.
+
+Точный COUNT(*) по большой ленте читает весь её индекс на каждый
+запрос. Здесь сначала считаются не больше FEED_COUNT_EXACT_LIMIT + 1
+записей: если их не больше предела, это и есть точное число. Для
+больших лент берётся оценка, сохранённая в кэше на FEED_COUNT_TIMEOUT
+секунд; для номеров страниц и ссылки на последнюю страницу неточность
+в пределах этого срока не важна, а «вперёд/назад» ходят по курсорам.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Post
+
+FEED_COUNT_KEY = 'feed:count:{}'
+
+
+def bounded_count(queryset, limit):
+    """Число записей набора, но не больше limit."""
+    return queryset.order_by()[:limit].count()
+
+
+def estimate_posts():
+    """
+    Оценка числа всех записей по диапазону первичного ключа: два поиска
+    по индексу вместо обхода таблицы. Записи почти только добавляются,
+    поэтому удалённые завышают оценку незначительно.
+    """
+    ids = Post.objects.order_by('pk').values_list('pk', flat=True)
+    first, last = ids.first(), ids.last()
+    return last - first + 1 if first is not None else 0
+
+
+def feed_count(queryset, scope, estimate=None):
+    """
+    Число записей ленты: точное для небольших лент, иначе из кэша или
+    ``estimate()`` (по умолчанию — точный подсчёт раз в срок кэша).
+    """
+    limit = settings.FEED_COUNT_EXACT_LIMIT
+    exact = bounded_count(queryset, limit + 1)
+    if exact <= limit:
+        return exact
+    key = FEED_COUNT_KEY.format(scope)
+    count = cache.get(key)
+    if count is None:
+        count = estimate() if estimate is not None else queryset.count()
+        cache.set(key, count, settings.FEED_COUNT_TIMEOUT)
+    # Устаревшая оценка не может быть меньше уже посчитанного
+    return max(count, exact)
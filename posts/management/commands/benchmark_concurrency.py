@@ -0,0 +1,121 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.urls import reverse
+from posts.benchmark import summarize
+from posts.models import Post, User
+from yatube.db import get_pragmas
+
+BENCHMARK_USERNAME = 'benchmark-writer'
+# Адрес не из INTERNAL_IPS: панель отладки не должна попадать в замер
+BENCHMARK_ADDR = '192.0.2.1'
+
+
+def read(client, urls, step):
+    response = client.get(urls['read'][step % len(urls['read'])])
+    if response.status_code != 200:
+        raise RuntimeError(response.status_code)
+
+
+def write(client, urls, step):
+    # Поочерёдно новая запись и комментарий
+    if step % 2:
+        response = client.post(urls['comment'],
+                               {'text': 'Комментарий для замера'})
+    else:
+        response = client.post(urls['new_post'],
+                               {'text': 'Запись для замера'})
+    if response.status_code != 302:
+        raise RuntimeError(response.status_code)
+
+
+ACTIONS = {'read': read, 'write': write}
+
+
+def run_worker(kind, urls, user_id, deadline):
+    """Выполняет действия до срока; возвращает время каждого и число ошибок."""
+    client = Client(REMOTE_ADDR=BENCHMARK_ADDR)
+    client.force_login(User.objects.get(pk=user_id))
+    action = ACTIONS[kind]
+    timings = []
+    errors = 0
+    step = 0
+    while time.time() < deadline:
+        started = time.perf_counter()
+        try:
+            action(client, urls, step)
+        except Exception:
+            errors += 1
+        else:
+            timings.append(time.perf_counter() - started)
+        step += 1
+    connections.close_all()
+    return kind, timings, errors
+
+
+class Command(BaseCommand):
+    help = ('Измеряет пропускную способность чтения страниц, пока другие '
+            'процессы непрерывно публикуют записи и комментарии. Записи '
+            f'создаются от пользователя {BENCHMARK_USERNAME} и удаляются '
+            'после замера')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4,
+                            help='Число читающих процессов')
+        parser.add_argument('--writers', type=int, default=1,
+                            help='Число пишущих процессов')
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Длительность каждой фазы, секунды')
+
+    def handle(self, *args, **options):
+        post = Post.objects.select_related('author').first()
+        if post is None:
+            raise CommandError('Для замера нужна хотя бы одна запись')
+        kwargs = {'username': post.author.username, 'post_id': post.id}
+        urls = {
+            'read': [reverse('posts:index'),
+                     reverse('posts:post', kwargs=kwargs)],
+            'comment': reverse('posts:add_comment', kwargs=kwargs),
+            'new_post': reverse('posts:new_post'),
+        }
+        writer, _ = User.objects.get_or_create(username=BENCHMARK_USERNAME)
+
+        self.stdout.write(f'SQLite: {get_pragmas(connection)}')
+        try:
+            # Сначала только чтение, затем чтение на фоне записи
+            for writers in (0, options['writers']):
+                stats = self.run_phase(urls, writer.pk, options['readers'],
+                                       writers, options['duration'])
+                self.report(writers, stats, options['duration'])
+        finally:
+            writer.delete()
+
+    def run_phase(self, urls, user_id, readers, writers, duration):
+        # Отдельные процессы, как воркеры сервера приложений: у каждого
+        # своё соединение с базой и нет общей блокировки интерпретатора
+        connections.close_all()
+        deadline = time.time() + duration
+        jobs = [('read', urls, user_id, deadline)] * readers
+        jobs += [('write', urls, user_id, deadline)] * writers
+        with multiprocessing.get_context('fork').Pool(len(jobs)) as pool:
+            results = pool.starmap(run_worker, jobs)
+        stats = {'read': [], 'write': [], 'errors': 0}
+        for kind, timings, errors in results:
+            stats[kind].extend(timings)
+            stats['errors'] += errors
+        return stats
+
+    def report(self, writers, stats, duration):
+        self.stdout.write(f'Пишущих процессов: {writers}')
+        for kind in ('read', 'write'):
+            summary = summarize(stats[kind], duration)
+            if not summary['count']:
+                continue
+            self.stdout.write(
+                f'  {kind}: {summary["rps"]} в секунду, '
+                f'медиана {summary["p50_ms"]} мс, p95 {summary["p95_ms"]} мс'
+            )
+        self.stdout.write(f'  ошибок: {stats["errors"]}')
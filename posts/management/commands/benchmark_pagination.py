@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.template.loader import render_to_string
+from posts.benchmark import summarize
+from posts.paginator import add_page_window
+from yatube.settings import RECORDS_ON_THE_PAGE
+
+
+class Command(BaseCommand):
+    help = ('Замеряет отрисовку навигации паджинатора при большом числе '
+            'страниц: время и размер HTML. Записи не нужны — паджинатор '
+            'строится по range нужной длины')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, nargs='+',
+                            default=[10, 1000, 100000, 1000000],
+                            help='Числа страниц для замера')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Отрисовок на каждое число страниц')
+
+    def handle(self, *args, **options):
+        for num_pages in options['pages']:
+            paginator = Paginator(range(num_pages * RECORDS_ON_THE_PAGE),
+                                  RECORDS_ON_THE_PAGE)
+            page = add_page_window(paginator.page(num_pages // 2 or 1))
+            timings = []
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                began = time.perf_counter()
+                html = render_to_string('includes/paginator.html',
+                                        {'page': page, 'page_query': ''})
+                timings.append(time.perf_counter() - began)
+            summary = summarize(timings, time.perf_counter() - started)
+            self.stdout.write(
+                f'{num_pages:>9} страниц: p50 {summary["p50_ms"]} мс, '
+                f'p95 {summary["p95_ms"]} мс, '
+                f'{len(html.encode()) / 1024:.1f} КиБ HTML')
@@ -0,0 +1,153 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from posts.benchmark import load_results, save_result, summarize
+from posts.models import AuthorStats, Comment, Follow, Group, Post, User
+
+BENCHMARK_USERNAME = 'benchmark-views'
+# Адрес не из INTERNAL_IPS: панель отладки не должна попадать в замер
+BENCHMARK_ADDR = '192.0.2.1'
+
+
+class Command(BaseCommand):
+    help = ('Замеряет время ответа, число запросов к БД и пропускную '
+            'способность страниц лент, записи и операций записи. '
+            'Результат дописывается в BENCHMARK_RESULTS_FILE и '
+            'сравнивается с предыдущим замером')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Запросов на каждый сценарий')
+        parser.add_argument('--cold', action='store_true',
+                            help='Очищать кэш перед каждым запросом')
+        parser.add_argument('--only', nargs='+', metavar='SCENARIO',
+                            help='Только указанные сценарии')
+        parser.add_argument('--no-save', action='store_true',
+                            help='Не сохранять результат')
+
+    def handle(self, *args, **options):
+        post = (Post.objects.select_related('author')
+                .order_by('-comment_count', '-pub_date').first())
+        group = Group.objects.filter(posts__isnull=False).first()
+        reader_stats = (AuthorStats.objects.select_related('user')
+                        .order_by('-following_count').first())
+        if post is None or group is None or reader_stats is None:
+            raise CommandError('Нет данных: запустите generate_dataset')
+        author = post.author.username
+        # Читает пользователь с самой большой лентой подписок, пишет —
+        # отдельный пользователь, которого удаляем после замера
+        reader = Client(REMOTE_ADDR=BENCHMARK_ADDR)
+        reader.force_login(reader_stats.user)
+        writer_user, _ = User.objects.get_or_create(
+            username=BENCHMARK_USERNAME)
+        writer = Client(REMOTE_ADDR=BENCHMARK_ADDR)
+        writer.force_login(writer_user)
+
+        post_kwargs = {'username': author, 'post_id': post.id}
+        depth = max(Post.objects.count() // 10 // 2, 1)
+        scenarios = {
+            'index': lambda step: reader.get(reverse('posts:index')),
+            'index_deep': lambda step: reader.get(
+                reverse('posts:index'), {'page': depth}),
+            'group_posts': lambda step: reader.get(
+                reverse('posts:blogs', kwargs={'slug': group.slug})),
+            'profile': lambda step: reader.get(
+                reverse('posts:profile', kwargs={'username': author})),
+            'post_view': lambda step: reader.get(
+                reverse('posts:post', kwargs=post_kwargs)),
+            'follow_index': lambda step: reader.get(
+                reverse('posts:follow_index')),
+            'new_post': lambda step: writer.post(
+                reverse('posts:new_post'), {'text': f'Запись {step}'}),
+            'add_comment': lambda step: writer.post(
+                reverse('posts:add_comment', kwargs=post_kwargs),
+                {'text': f'Комментарий {step}'}),
+            'follow': lambda step: writer.get(reverse(
+                'posts:profile_unfollow' if step % 2
+                else 'posts:profile_follow',
+                kwargs={'username': author})),
+        }
+        names = options['only'] or list(scenarios)
+        unknown = set(names) - scenarios.keys()
+        if unknown:
+            raise CommandError(f'Нет сценариев: {", ".join(unknown)}')
+
+        results = {}
+        try:
+            for name in names:
+                results[name] = self.measure(
+                    scenarios[name], options['requests'], options['cold'])
+                self.report(name, results[name])
+        finally:
+            writer_user.delete()
+
+        result = {
+            'cold': options['cold'],
+            'dataset': {
+                'users': User.objects.count(),
+                'posts': Post.objects.count(),
+                'comments': Comment.objects.count(),
+                'follows': Follow.objects.count(),
+            },
+            'scenarios': results,
+        }
+        previous = [record for record in load_results()
+                    if record.get('cold') == options['cold']
+                    and record.get('dataset') == result['dataset']]
+        if previous:
+            self.compare(previous[-1], results)
+        if not options['no_save']:
+            record = save_result(result)
+            self.stdout.write(f'Сохранено для коммита {record["commit"]}')
+
+    def measure(self, request, count, cold):
+        timings = []
+        queries = []
+        started = time.perf_counter()
+        for step in range(count):
+            if cold:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                began = time.perf_counter()
+                response = request(step)
+                timings.append(time.perf_counter() - began)
+            if response.status_code >= 400:
+                raise CommandError(
+                    f'{response.request["PATH_INFO"]}: '
+                    f'ответ {response.status_code}')
+            queries.append(len(captured))
+        summary = summarize(timings, time.perf_counter() - started)
+        summary['queries_mean'] = round(sum(queries) / len(queries), 1)
+        summary['queries_max'] = max(queries)
+        return summary
+
+    def report(self, name, summary):
+        self.stdout.write(
+            f'{name:<13} {summary["rps"]:>8} в секунду  '
+            f'p50 {summary["p50_ms"]:>8} мс  '
+            f'p95 {summary["p95_ms"]:>8} мс  '
+            f'p99 {summary["p99_ms"]:>8} мс  '
+            f'запросов {summary["queries_mean"]} '
+            f'(до {summary["queries_max"]})'
+        )
+
+    def compare(self, previous, results):
+        self.stdout.write(
+            f'Сравнение с коммитом {previous.get("commit")} '
+            f'({previous.get("time")}):')
+        for name, summary in results.items():
+            before = previous['scenarios'].get(name)
+            if not before or not before['p50_ms']:
+                continue
+            change = (summary['p50_ms'] - before['p50_ms']) / before['p50_ms']
+            style = self.style.ERROR if change > 0.1 else self.style.SUCCESS
+            self.stdout.write(style(
+                f'  {name:<13} p50 {before["p50_ms"]} -> '
+                f'{summary["p50_ms"]} мс ({change:+.0%}), запросов '
+                f'{before["queries_mean"]} -> {summary["queries_mean"]}'
+            ))
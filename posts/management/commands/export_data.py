@@ -0,0 +1,32 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from posts.transfer import FIELDS, write_csv, write_jsonl
+
+
+class Command(BaseCommand):
+    help = ('Выгружает сообщества, записи, комментарии и подписки в JSONL '
+            'или CSV, не загружая таблицы в память целиком')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=('jsonl', 'csv'),
+                            default='jsonl')
+        parser.add_argument('--model', choices=list(FIELDS),
+                            help='Только одна модель; для CSV обязательно')
+        parser.add_argument('--output', help='Файл; по умолчанию stdout')
+
+    def handle(self, *args, **options):
+        model = options['model']
+        if options['format'] == 'csv' and not model:
+            raise CommandError('Для CSV укажите --model')
+        output = options['output']
+        stream = (open(output, 'w', encoding='utf-8', newline='')
+                  if output else sys.stdout)
+        try:
+            if options['format'] == 'csv':
+                write_csv(stream, model)
+            else:
+                write_jsonl(stream, [model] if model else list(FIELDS))
+        finally:
+            if output:
+                stream.close()
@@ -0,0 +1,102 @@
+import itertools
+import random
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.utils import timezone
+from posts.models import Post
+from posts.transfer import Importer
+
+WORDS = '''
+    кот собака утро вечер город река лес дорога друг работа книга музыка
+    фильм поезд море солнце дождь снег зима лето весна осень кофе чай
+    завтрак обед ужин проект код тест сервер база запрос страница лента
+    запись комментарий подписка автор сообщество фотография прогулка
+    парк небо звезда окно дом семья праздник путешествие горы новость
+    идея вопрос ответ история мечта неделя выходные отпуск
+'''.split()
+
+
+class Command(BaseCommand):
+    help = ('Создаёт синтетические данные для замеров: пользователей, '
+            'сообщества, записи, комментарии и подписки. Популярность '
+            'авторов распределена по степенному закону: немногие пишут '
+            'много и имеют большинство подписчиков')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=50000)
+        parser.add_argument('--follows', type=float, default=20,
+                            help='Среднее число подписок пользователя')
+        parser.add_argument('--alpha', type=float, default=1.1,
+                            help='Показатель степенного закона '
+                                 'популярности авторов')
+        parser.add_argument('--days', type=int, default=365,
+                            help='За сколько дней распределить записи')
+        parser.add_argument('--prefix', default='user',
+                            help='Начало имён создаваемых пользователей')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        usernames = [f'{options["prefix"]}{number}'
+                     for number in range(options['users'])]
+        # Вес автора убывает с номером как 1 / n^alpha
+        self.popularity = list(itertools.accumulate(
+            1 / (rank + 1) ** options['alpha']
+            for rank in range(len(usernames))
+        ))
+        self.usernames = usernames
+        slugs = [f'{options["prefix"]}-group-{number}'
+                 for number in range(options['groups'])]
+
+        importer = Importer()
+        for slug in slugs:
+            importer.add('group', {'slug': slug, 'title': slug,
+                                   'description': self.text(5, 20)})
+        first_id = (Post.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        start = timezone.now() - timedelta(days=options['days'])
+        step = timedelta(days=options['days']) / max(options['posts'], 1)
+
+        def date_of(index):
+            return start + step * index
+
+        for index in range(options['posts']):
+            importer.add('post', {
+                'id': first_id + index,
+                'author': self.popular_user(),
+                'group': (self.random.choice(slugs)
+                          if slugs and self.random.random() < 0.5 else None),
+                'text': self.text(5, 60),
+                'pub_date': date_of(index).isoformat(),
+            })
+        for _ in range(options['comments'] if options['posts'] else 0):
+            index = self.random.randrange(options['posts'])
+            created = date_of(index) + timedelta(
+                minutes=self.random.expovariate(1 / 60))
+            importer.add('comment', {
+                'post': first_id + index,
+                'author': self.random.choice(usernames),
+                'text': self.text(3, 30),
+                'created': created.isoformat(),
+            })
+        for username in usernames:
+            count = int(self.random.expovariate(1 / options['follows']))
+            authors = {self.popular_user() for _ in range(count)}
+            for author in authors - {username}:
+                importer.add('follow', {'user': username, 'author': author})
+
+        counts = importer.finish()
+        self.stdout.write(self.style.SUCCESS('Создано: ' + ', '.join(
+            f'{model} — {count}' for model, count in counts.items())))
+
+    def popular_user(self):
+        return self.random.choices(self.usernames,
+                                   cum_weights=self.popularity)[0]
+
+    def text(self, shortest, longest):
+        length = self.random.randint(shortest, longest)
+        return ' '.join(self.random.choices(WORDS, k=length)).capitalize()
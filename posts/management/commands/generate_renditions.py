@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from posts.thumbnails import schedule_all_renditions
+
+
+class Command(BaseCommand):
+    help = ('Ставит в очередь создание миниатюр картинок записей. Нужна '
+            'для записей, которые появились без задачи: показ страниц '
+            'миниатюры не заказывает')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true',
+                            help='Только записи, у которых готовы не все '
+                                 'миниатюры')
+
+    def handle(self, *args, **options):
+        scheduled = schedule_all_renditions(missing_only=options['missing'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Поставлено в очередь записей: {scheduled}'))
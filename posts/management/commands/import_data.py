@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from posts.transfer import BATCH_SIZE, FIELDS, Importer, read_csv, read_jsonl
+
+
+class Command(BaseCommand):
+    help = ('Загружает сообщества, записи, комментарии и подписки из JSONL '
+            'или CSV пачками через bulk_create. Уже загруженные строки '
+            '(тот же slug, подписка, запись или комментарий) пропускаются; '
+            'записи и комментарии с занятым id получают новый')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('jsonl', 'csv'),
+                            help='По умолчанию — по расширению файла')
+        parser.add_argument('--model', choices=list(FIELDS),
+                            help='Модель строк CSV-файла')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or (
+            'csv' if path.endswith('.csv') else 'jsonl')
+        if file_format == 'csv' and not options['model']:
+            raise CommandError('Для CSV укажите --model')
+        importer = Importer(batch_size=options['batch_size'])
+        with open(path, encoding='utf-8', newline='') as stream:
+            records = (read_csv(stream, options['model'])
+                       if file_format == 'csv' else read_jsonl(stream))
+            try:
+                for model_name, record in records:
+                    importer.add(model_name or options['model'], record)
+                counts = importer.finish()
+            except (ValueError, KeyError) as error:
+                raise CommandError(f'Ошибка в данных: {error}')
+        self.stdout.write(self.style.SUCCESS('Обработано: ' + ', '.join(
+            f'{model} — {count}' for model, count in counts.items())))
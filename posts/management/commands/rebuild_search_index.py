@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from posts.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Заново строит поисковый индекс всех записей'
+
+    def handle(self, *args, **options):
+        indexed = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано записей: {indexed}'))
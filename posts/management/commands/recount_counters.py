@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from posts.counters import recount_all
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики записей, подписчиков, подписок '
+            'и комментариев по фактическим данным')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            stats, posts = recount_all()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано: авторов — {stats}, записей — {posts}'))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from posts import tasks
+
+
+class Command(BaseCommand):
+    help = ('Выполняет задачи фоновой очереди: раскладку записей по лентам, '
+            'индекс поиска, миниатюры. Для нескольких воркеров достаточно '
+            'запустить команду несколько раз')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Выполнить готовые задачи и завершиться')
+        parser.add_argument('--batch', type=int, default=100,
+                            help='Сколько задач забирать за раз')
+        parser.add_argument('--sleep', type=float, default=1,
+                            help='Пауза, когда очередь пуста, секунды')
+        parser.add_argument('--stats', action='store_true',
+                            help='Показать очередь и завершиться')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.report()
+            return
+        while True:
+            done, failed = tasks.run_pending(options['batch'])
+            if done or failed:
+                self.stdout.write(
+                    f'Выполнено: {done}, с ошибкой: {failed}')
+            if options['once'] and not (done or failed):
+                return
+            close_old_connections()
+            if not (done or failed):
+                time.sleep(options['sleep'])
+
+    def report(self):
+        backlog = tasks.backlog()
+        if not backlog:
+            self.stdout.write('Очередь пуста')
+        for (name, status), count in sorted(backlog.items()):
+            self.stdout.write(f'{name:<40} {status:<10} {count}')
+        self.stdout.write(f'Задержка: {tasks.lag():.1f} с')
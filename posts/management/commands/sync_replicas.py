@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from yatube.routers import PRIMARY
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite во все реплики из '
+            'DATABASE_REPLICAS — замена репликации для локальной проверки')
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('Реплики не настроены (YATUBE_DB_REPLICAS)')
+        primary = connections[PRIMARY]
+        if primary.vendor != 'sqlite':
+            raise CommandError('Команда работает только с SQLite')
+        primary.ensure_connection()
+        for alias in settings.DATABASE_REPLICAS:
+            replica = connections[alias]
+            replica.ensure_connection()
+            # Онлайн-копия страниц базы: основная база остаётся доступной
+            primary.connection.backup(replica.connection)
+            self.stdout.write(self.style.SUCCESS(f'{alias}: скопировано'))
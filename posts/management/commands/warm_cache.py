@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from posts.warmup import hot_urls, warm
+
+
+class Command(BaseCommand):
+    help = ('Заранее собирает и кэширует первые страницы главной, '
+            'популярных сообществ и профилей, чтобы после выкладки первые '
+            'посетители не собирали их из базы одновременно')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int,
+                            default=settings.CACHE_WARMUP_PAGES,
+                            help='Сколько первых страниц каждой ленты')
+        parser.add_argument('--groups', type=int,
+                            default=settings.CACHE_WARMUP_GROUPS,
+                            help='Сколько сообществ с наибольшим числом '
+                                 'записей')
+        parser.add_argument('--profiles', type=int,
+                            default=settings.CACHE_WARMUP_PROFILES,
+                            help='Сколько авторов с наибольшим числом '
+                                 'подписчиков')
+        parser.add_argument('--workers', type=int,
+                            default=settings.CACHE_WARMUP_WORKERS,
+                            help='Сколько страниц собирать одновременно')
+
+    def handle(self, *args, **options):
+        urls = hot_urls(options['pages'], options['groups'],
+                        options['profiles'])
+        started = time.perf_counter()
+        results = warm(urls, options['workers'])
+        failed = 0
+        for url, status, duration in results:
+            if status != 200:
+                failed += 1
+            if options['verbosity'] > 1 or status != 200:
+                self.stdout.write(f'{status} {duration * 1000:8.1f} мс {url}')
+        self.stdout.write(
+            f'Прогрето страниц: {len(results) - failed}, с ошибкой: {failed}, '
+            f'за {time.perf_counter() - started:.1f} с')
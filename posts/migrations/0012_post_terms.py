@@ -0,0 +1,185 @@
+# Generated by Django 2.2.28 on 2026-10-17 07:41
+
+import math
+import re
+from collections import Counter
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Копия токенизатора и весов posts.search и стеммера posts.stemmer на
+# момент миграции: историческая миграция не должна меняться вместе с
+# кодом приложения. После изменения алгоритма индекс перестраивается
+# командой rebuild_search_index.
+BATCH_SIZE = 500
+MAX_TERM_LENGTH = 64
+
+WORD_RE = re.compile(r'\w+')
+CYRILLIC_RE = re.compile('[а-яё]')
+STOP_WORDS = frozenset('''
+    а без бы в во вот вы да для до его её ее если есть же за и из или им
+    их к как ко ли мы на не нет но о об он она они оно от по под при с со
+    так то тоже только ты у уж что это я
+'''.split())
+
+VOWELS = 'аеиоуыэюя'
+
+
+def _endings(after_a_ya='', other=''):
+    """Окончания группы: {окончание: нужна ли перед ним «а» или «я»}."""
+    endings = dict.fromkeys(other.split(), False)
+    endings.update(dict.fromkeys(after_a_ya.split(), True))
+    return endings
+
+
+PERFECTIVE_GERUND = _endings(
+    'в вши вшись',
+    'ив ивши ившись ыв ывши ывшись',
+)
+ADJECTIVE = _endings(
+    other='ее ие ые ое ими ыми ей ий ый ой ем им ым ом его ого ему ому '
+          'их ых ую юю ая яя ою ею',
+)
+PARTICIPLE = _endings('ем нн вш ющ щ', 'ивш ывш ующ')
+REFLEXIVE = _endings(other='ся сь')
+VERB = _endings(
+    'ла на ете йте ли й л ем н ло но ет ют ны ть ешь нно',
+    'ила ыла ена ейте уйте ите или ыли ей уй ил ыл им ым ен ило ыло ено '
+    'ят ует уют ит ыт ены ить ыть ишь ую ю',
+)
+NOUN = _endings(
+    other='а ев ов ие ье е иями ями ами еи ии и ией ей ой ий й иям ям ием '
+          'ем ам ом о у ах иях ях ы ь ию ью ю ия ья я',
+)
+DERIVATIONAL = _endings(other='ост ость')
+SUPERLATIVE = _endings(other='ейш ейше')
+
+
+def _regions(word):
+    """Начала областей RV и R2."""
+    rv = next((i + 1 for i, char in enumerate(word) if char in VOWELS),
+              len(word))
+
+    def after_vowel_consonant(start):
+        for i in range(start + 1, len(word)):
+            if word[i - 1] in VOWELS and word[i] not in VOWELS:
+                return i + 1
+        return len(word)
+
+    r2 = after_vowel_consonant(after_vowel_consonant(0))
+    return rv, r2
+
+
+def _strip(word, start, endings):
+    """
+    Отрезает самое длинное окончание группы, лежащее в word[start:].
+    Возвращает новое слово или None, если окончание не подошло.
+    """
+    for length in range(min(len(word) - start, 6), 0, -1):
+        ending = word[-length:]
+        if ending not in endings:
+            continue
+        if endings[ending]:
+            # Окончание отрезается, а «а»/«я» перед ним остаётся
+            if (len(word) - length - 1 < start
+                    or word[-length - 1] not in 'ая'):
+                return None
+        return word[:-length]
+    return None
+
+
+def stem(word):
+    """Основа слова в нижнем регистре."""
+    word = word.lower().replace('ё', 'е')
+    rv, r2 = _regions(word)
+
+    # Шаг 1: деепричастие, иначе возвратная частица и затем
+    # прилагательное (с причастием), глагол или существительное
+    stripped = _strip(word, rv, PERFECTIVE_GERUND)
+    if stripped is not None:
+        word = stripped
+    else:
+        word = _strip(word, rv, REFLEXIVE) or word
+        adjective = _strip(word, rv, ADJECTIVE)
+        if adjective is not None:
+            word = _strip(adjective, rv, PARTICIPLE) or adjective
+        else:
+            word = (_strip(word, rv, VERB)
+                    or _strip(word, rv, NOUN)
+                    or word)
+
+    # Шаг 2
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Шаг 3: словообразовательный суффикс целиком в R2
+    word = _strip(word, r2, DERIVATIONAL) or word
+
+    # Шаг 4: превосходная степень, двойное «н», мягкий знак
+    superlative = _strip(word, rv, SUPERLATIVE)
+    if superlative is not None:
+        word = superlative
+    if word.endswith('нн') and len(word) - 2 >= rv:
+        word = word[:-1]
+    elif (superlative is None and word.endswith('ь')
+            and len(word) - 1 >= rv):
+        word = word[:-1]
+    return word
+
+
+def tokenize(text):
+    terms = []
+    for word in WORD_RE.findall(text.lower()):
+        if word in STOP_WORDS or (len(word) < 2 and not word.isdigit()):
+            continue
+        if CYRILLIC_RE.search(word):
+            word = stem(word)
+        terms.append(word[:MAX_TERM_LENGTH])
+    return terms
+
+
+def post_terms(text):
+    counts = Counter(tokenize(text))
+    if not counts:
+        return []
+    norm = math.sqrt(sum(counts.values()))
+    return [(term, (1 + math.log(count)) / norm)
+            for term, count in counts.items()]
+
+
+def build_index(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    PostTerm = apps.get_model('posts', 'PostTerm')
+    PostTerm.objects.bulk_create(
+        (
+            PostTerm(post_id=post_id, term=term, weight=weight)
+            for post_id, text in Post.objects.values_list(
+                'id', 'text').iterator()
+            for term, weight in post_terms(text)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, verbose_name='основа')),
+                ('weight', models.FloatField(verbose_name='вес')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='posts.Post')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='postterm',
+            constraint=models.UniqueConstraint(fields=('term', 'post'), name='unique_post_term'),
+        ),
+        migrations.RunPython(build_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 2.2.28 on 2026-10-17 07:58
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_post_terms'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='функция')),
+                ('args', models.TextField(default='[]', verbose_name='аргументы')),
+                ('status', models.CharField(choices=[('pending', 'ожидает'), ('running', 'выполняется'), ('failed', 'не выполнена')], default='pending', max_length=10, verbose_name='состояние')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='попыток')),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='выполнить после')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='занята до')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='создана')),
+                ('last_error', models.TextField(blank=True, verbose_name='последняя ошибка')),
+            ],
+            options={
+                'ordering': ['run_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['status', 'run_at'], name='task_status_run_at_idx'),
+        ),
+    ]
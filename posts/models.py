@@ -1,5 +1,6 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -17,6 +18,12 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Записи для ленты: автор и сообщество одним запросом."""
+        return self.select_related('author', 'group')
+
+
 class Post(models.Model):
     text = models.TextField(
         verbose_name='Текст сообщения',
@@ -45,9 +52,31 @@ class Post(models.Model):
         verbose_name='Изображение',
         help_text='Выберите картинку для загрузки',
     )
+    comment_count = models.PositiveIntegerField(
+        'количество комментариев',
+        default=0,
+        editable=False,
+    )
+    # Растёт при каждом сохранении записи, входит в ключ кэша карточки
+    version = models.PositiveIntegerField(
+        'версия',
+        default=0,
+        editable=False,
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
+        # Ленты сообщества и автора читают диапазон индекса с конца.
+        # Индексы по возрастанию: SQLite хранит в них и id, поэтому
+        # обратный проход даёт порядок (-pub_date, -id) без сортировки
+        indexes = [
+            models.Index(fields=['group', 'pub_date'],
+                         name='post_group_pub_date_idx'),
+            models.Index(fields=['author', 'pub_date'],
+                         name='post_author_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -77,6 +106,10 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(fields=['post', 'created'],
+                         name='comment_post_created_idx')
+        ]
 
 
 class Follow(models.Model):
@@ -96,3 +129,102 @@ class Follow(models.Model):
             models.UniqueConstraint(
                 fields=['user', 'author'], name='unique_follow')
         ]
+        # Уникальный индекс начинается с user; подписчиков автора
+        # ищем по обратному
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx')
+        ]
+
+
+class AuthorStats(models.Model):
+    """Поддерживаемые счётчики пользователя для карточки автора."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    posts_count = models.PositiveIntegerField('записей', default=0)
+    followers_count = models.PositiveIntegerField('подписчиков', default=0)
+    following_count = models.PositiveIntegerField('подписок', default=0)
+
+
+class TimelineEntry(models.Model):
+    """Запись в материализованной ленте подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    # Копия post.pub_date, чтобы лента читалась по одному индексу
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-pub_date']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_timeline_entry')
+        ]
+        indexes = [
+            models.Index(fields=['user', 'pub_date', 'post'],
+                         name='timeline_user_date_idx')
+        ]
+
+
+class PostTerm(models.Model):
+    """Основа слова в тексте записи — строка обратного индекса поиска."""
+    term = models.CharField('основа', max_length=64)
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='terms'
+    )
+    # Вклад основы в релевантность записи (posts.search.post_terms)
+    weight = models.FloatField('вес')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['term', 'post'], name='unique_post_term')
+        ]
+
+
+class Task(models.Model):
+    """Отложенный побочный эффект записи для фоновой очереди (posts.tasks)."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = [
+        (PENDING, 'ожидает'),
+        (RUNNING, 'выполняется'),
+        (FAILED, 'не выполнена'),
+    ]
+
+    name = models.CharField('функция', max_length=200)
+    # Аргументы функции в JSON
+    args = models.TextField('аргументы', default='[]')
+    status = models.CharField('состояние', max_length=10, choices=STATUSES,
+                              default=PENDING)
+    attempts = models.PositiveSmallIntegerField('попыток', default=0)
+    run_at = models.DateTimeField('выполнить после', default=timezone.now)
+    # Взятая воркером задача, не завершённая к этому времени, считается
+    # брошенной и выдаётся снова
+    locked_until = models.DateTimeField('занята до', null=True, blank=True)
+    created = models.DateTimeField('создана', auto_now_add=True)
+    last_error = models.TextField('последняя ошибка', blank=True)
+
+    class Meta:
+        ordering = ['run_at']
+        indexes = [
+            models.Index(fields=['status', 'run_at'],
+                         name='task_status_run_at_idx')
+        ]
+
+    def __str__(self):
+        return f'{self.name}{self.args}'
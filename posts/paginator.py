@@ -0,0 +1,225 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from yatube.settings import RECORDS_ON_THE_PAGE
+
+# Окно номеров страниц: соседей текущей с каждой стороны и страниц
+# у начала и конца; пропуски между ними обозначены None
+PAGES_ON_EACH_SIDE = 3
+PAGES_ON_ENDS = 2
+
+
+def encode_cursor(values):
+    """Упаковывает значения ключа сортировки в токен для URL."""
+    raw = json.dumps([str(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token, fields):
+    """
+    Распаковывает токен в значения полей ключа сортировки.
+    Для испорченного токена возвращает None.
+    """
+    try:
+        padding = '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(token + padding))
+        if len(values) != len(fields):
+            return None
+        return [field.to_python(value)
+                for field, value in zip(fields, values)]
+    except (binascii.Error, ValueError, TypeError, ValidationError):
+        return None
+
+
+class CursorPage:
+    """Страница курсорного паджинатора, совместимая с шаблонами ленты."""
+    is_cursor = True
+    number = None
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    @property
+    def next_cursor(self):
+        if self.has_next():
+            return self.paginator.cursor_for(self.object_list[-1])
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous():
+            return self.paginator.cursor_for(self.object_list[0])
+        return None
+
+
+class CursorPaginator:
+    """
+    Постраничный вывод по ключу сортировки (keyset pagination).
+
+    Вместо LIMIT/OFFSET и COUNT(*) выбирает записи строго старше
+    (``after``) или новее (``before``) переданного курсора, поэтому
+    стоимость страницы не зависит от её глубины.
+    """
+
+    DEFAULT_ORDERING = ('pub_date', 'id')
+
+    def __init__(self, object_list, per_page, ordering=None):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        if ordering is None:
+            # Явный order_by набора (например, по аннотациям) задаёт ключ,
+            # иначе записи идут по дате публикации
+            ordering = tuple(
+                name.lstrip('-') for name in object_list.query.order_by
+            ) or self.DEFAULT_ORDERING
+        self.ordering = ordering
+        self.fields = []
+        self.attnames = []
+        for name in ordering:
+            annotation = object_list.query.annotations.get(name)
+            if annotation is not None:
+                self.fields.append(annotation.output_field)
+                self.attnames.append(name)
+            else:
+                field = object_list.model._meta.get_field(name)
+                self.fields.append(field)
+                self.attnames.append(field.attname)
+
+    def cursor_for(self, obj):
+        return encode_cursor(getattr(obj, name) for name in self.attnames)
+
+    def _keyset_filter(self, values, lookup):
+        # (a, b) < (x, y)  <=>  a < x OR (a = x AND b < y)
+        condition = Q()
+        for position, name in enumerate(self.ordering):
+            term = Q(**{f'{name}__{lookup}': values[position]})
+            for previous, value in zip(self.ordering[:position], values):
+                term &= Q(**{previous: value})
+            condition |= term
+        return condition
+
+    def get_page(self, after=None, before=None):
+        descending = [f'-{name}' for name in self.ordering]
+        ascending = list(self.ordering)
+        after_values = decode_cursor(after, self.fields) if after else None
+        before_values = decode_cursor(before, self.fields) if before else None
+
+        if before_values is not None:
+            queryset = self.object_list.filter(
+                self._keyset_filter(before_values, 'gt')
+            ).order_by(*ascending)
+            items = list(queryset[:self.per_page + 1])
+            has_previous = len(items) > self.per_page
+            items = items[:self.per_page][::-1]
+            return CursorPage(items, self, has_next=True,
+                              has_previous=has_previous)
+
+        queryset = self.object_list.order_by(*descending)
+        if after_values is not None:
+            queryset = queryset.filter(
+                self._keyset_filter(after_values, 'lt'))
+        items = list(queryset[:self.per_page + 1])
+        has_next = len(items) > self.per_page
+        return CursorPage(items[:self.per_page], self, has_next=has_next,
+                          has_previous=after_values is not None)
+
+
+def page_window(number, num_pages, on_each_side=PAGES_ON_EACH_SIDE,
+                on_ends=PAGES_ON_ENDS):
+    """
+    Номера страниц для навигации: первые и последние on_ends страниц и
+    on_each_side соседей текущей, None на месте пропущенных. Длина не
+    зависит от числа страниц, например для 500 из 1000:
+    ``[1, 2, None, 497, 498, 499, 500, 501, 502, 503, None, 999, 1000]``.
+    """
+    if num_pages <= (on_each_side + on_ends) * 2:
+        return list(range(1, num_pages + 1))
+    window = []
+    if number > on_each_side + on_ends + 2:
+        window.extend(range(1, on_ends + 1))
+        window.append(None)
+        window.extend(range(number - on_each_side, number))
+    else:
+        window.extend(range(1, number))
+    if number < num_pages - on_each_side - on_ends - 1:
+        window.extend(range(number, number + on_each_side + 1))
+        window.append(None)
+        window.extend(range(num_pages - on_ends + 1, num_pages + 1))
+    else:
+        window.extend(range(number, num_pages + 1))
+    return window
+
+
+def add_page_window(page):
+    """Кладёт в page.page_window номера для шаблона паджинатора."""
+    page.page_window = page_window(page.number, page.paginator.num_pages)
+    return page
+
+
+def paginate(request, object_list, per_page=RECORDS_ON_THE_PAGE,
+             count=None):
+    """
+    Возвращает пару (paginator, page) для ленты.
+
+    Параметры ``?after=``/``?before=`` включают курсорный режим,
+    ``?page=N`` по-прежнему работает через обычный Paginator.
+    ``count()``, если передана, возвращает число записей вместо
+    COUNT(*) (posts.counting) и вызывается только для нумерованных страниц.
+    """
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    if after or before:
+        paginator = CursorPaginator(object_list, per_page)
+        return paginator, paginator.get_page(after=after, before=before)
+
+    paginator = Paginator(object_list, per_page)
+    if count is not None:
+        # Paginator.count — cached_property: значение в __dict__ экземпляра
+        # заменяет подсчёт, а тип паджинатора остаётся прежним
+        paginator.__dict__['count'] = count()
+    page = paginator.get_page(request.GET.get('page'))
+    if count is not None and not page.object_list and page.number > 1:
+        # Оценка числа записей оказалась больше настоящего (удалённые
+        # записи): последние страницы пусты. Считаем точно и отдаём
+        # последнюю непустую страницу
+        paginator.__dict__['count'] = object_list.count()
+        paginator.__dict__.pop('num_pages', None)
+        page = paginator.get_page(page.number)
+    add_page_window(page)
+    cursors = CursorPaginator(object_list, per_page)
+    # Ссылки «вперёд/назад» ведут в курсорный режим, чтобы переход
+    # по глубоким страницам не упирался в OFFSET.
+    if page.object_list:
+        if page.has_next():
+            page.next_cursor = cursors.cursor_for(page[-1])
+        if page.has_previous():
+            page.previous_cursor = cursors.cursor_for(page[0])
+    return paginator, page
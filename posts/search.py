@@ -0,0 +1,160 @@
+"""
+Полнотекстовый поиск по записям.
+
+Текст записи разбивается на слова, слова приводятся к основам русским
+стеммером, и для каждой основы в таблицу PostTerm кладётся строка
+(основа, запись, вес). Поиск находит записи, содержащие все основы
+запроса, через уникальный индекс (term, post) вместо LIKE '%...%' по всей
+таблице, и упорядочивает их по сумме весов, умноженных на IDF основы.
+
+Индекс записи перестраивается фоновой задачей после её сохранения,
+строки удалённой записи удаляются каскадом.
+"""
+import math
+import re
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Sum, Value, When
+
+from .counting import estimate_posts
+from .models import Post, PostTerm
+from .stemmer import stem
+from .tasks import task
+
+MAX_TERM_LENGTH = PostTerm._meta.get_field('term').max_length
+BATCH_SIZE = 500
+
+WORD_RE = re.compile(r'\w+')
+CYRILLIC_RE = re.compile('[а-яё]')
+STOP_WORDS = frozenset('''
+    а без бы в во вот вы да для до его её ее если есть же за и из или им
+    их к как ко ли мы на не нет но о об он она они оно от по под при с со
+    так то тоже только ты у уж что это я
+'''.split())
+
+
+def tokenize(text):
+    """Основы значимых слов текста по порядку."""
+    terms = []
+    for word in WORD_RE.findall(text.lower()):
+        if word in STOP_WORDS or (len(word) < 2 and not word.isdigit()):
+            continue
+        if CYRILLIC_RE.search(word):
+            word = stem(word)
+        terms.append(word[:MAX_TERM_LENGTH])
+    return terms
+
+
+def post_terms(text):
+    """
+    Пары (основа, вес) для текста записи.
+
+    Вес растёт логарифмически с числом повторов основы и нормирован
+    на длину текста, чтобы длинные записи не выигрывали только за счёт
+    объёма.
+    """
+    counts = Counter(tokenize(text))
+    if not counts:
+        return []
+    norm = math.sqrt(sum(counts.values()))
+    return [(term, (1 + math.log(count)) / norm)
+            for term, count in counts.items()]
+
+
+@task
+def index_post(post_id):
+    """Перестраивает индекс одной записи."""
+    text = Post.objects.filter(pk=post_id).values_list(
+        'text', flat=True).first()
+    with transaction.atomic():
+        PostTerm.objects.filter(post_id=post_id).delete()
+        if text is not None:
+            PostTerm.objects.bulk_create(
+                PostTerm(post_id=post_id, term=term, weight=weight)
+                for term, weight in post_terms(text)
+            )
+
+
+def rebuild_index():
+    """Строит индекс всех записей заново; возвращает число записей."""
+    indexed = 0
+    with transaction.atomic():
+        PostTerm.objects.all().delete()
+        batch = []
+        for post_id, text in Post.objects.values_list(
+                'id', 'text').iterator():
+            indexed += 1
+            batch.extend(PostTerm(post_id=post_id, term=term, weight=weight)
+                         for term, weight in post_terms(text))
+            if len(batch) >= BATCH_SIZE:
+                PostTerm.objects.bulk_create(batch)
+                batch = []
+        PostTerm.objects.bulk_create(batch)
+    return indexed
+
+
+def index_missing():
+    """
+    Индексирует записи, у которых ещё нет строк в индексе (например,
+    загруженные через bulk_create). Возвращает их число.
+    """
+    indexed = 0
+    batch = []
+    posts = Post.objects.filter(terms__isnull=True).values_list('id', 'text')
+    for post_id, text in posts.iterator():
+        indexed += 1
+        batch.extend(PostTerm(post_id=post_id, term=term, weight=weight)
+                     for term, weight in post_terms(text))
+        if len(batch) >= BATCH_SIZE:
+            PostTerm.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    PostTerm.objects.bulk_create(batch, ignore_conflicts=True)
+    return indexed
+
+
+def search_posts(query):
+    """
+    Записи, содержащие все слова запроса, от более подходящих к менее.
+    У каждой записи есть аннотация rank.
+    """
+    terms = sorted(set(tokenize(query)))
+    if not terms:
+        return Post.objects.none()
+    frequencies = dict(
+        PostTerm.objects.filter(term__in=terms)
+        .order_by()
+        .values_list('term')
+        .annotate(Count('post'))
+    )
+    if len(frequencies) < len(terms):
+        # Хотя бы одного слова нет ни в одной записи
+        return Post.objects.none()
+    # Для IDF хватает оценки числа записей без COUNT(*) по таблице
+    total = estimate_posts()
+    rank = Sum(Case(
+        *[When(terms__term=term,
+               then=F('terms__weight') * Value(
+                   math.log(1 + total / frequency)))
+          for term, frequency in frequencies.items()],
+        output_field=FloatField(),
+    ))
+    return (
+        Post.objects.filter(terms__term__in=terms)
+        .annotate(rank=rank, matched=Count('terms'))
+        .filter(matched=len(terms))
+        .order_by('-rank', '-pub_date')
+    )
+
+
+def search_post_ids(query):
+    """Подзапрос с id записей, содержащих все слова запроса."""
+    terms = set(tokenize(query))
+    return (
+        PostTerm.objects.filter(term__in=terms)
+        .order_by()
+        .values('post')
+        .annotate(matched=Count('term'))
+        .filter(matched=len(terms))
+        .values('post')
+    )
@@ -0,0 +1,108 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from yatube.metrics import collect_metrics
+
+from . import counters, search, tasks, timeline
+from .cache import (author_scope, bump_generations, forget_post_card,
+                    group_scope, post_scopes)
+from .models import AuthorStats, Comment, Follow, Post, Task, User
+
+
+def bump_post_feeds(post_id):
+    # Запись может быть уже удалена каскадом — тогда её ленты обновит
+    # сигнал удаления самой записи
+    post = Post.objects.select_related('author', 'group').filter(
+        pk=post_id).first()
+    if post is not None:
+        bump_generations(post_scopes(post))
+
+
+def bump_profiles(*user_ids):
+    usernames = User.objects.filter(pk__in=user_ids).values_list(
+        'username', flat=True)
+    bump_generations([author_scope(username) for username in usernames])
+
+
+@receiver(pre_save, sender=Post)
+def post_changing(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        instance.version += 1
+        # Запись могла уйти из прежнего сообщества — его ленту тоже
+        # нужно обновить
+        instance._previous_group_slug = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list('group__slug', flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, update_fields=None,
+               **kwargs):
+    if raw:
+        return
+    if update_fields is None or 'text' in update_fields:
+        tasks.enqueue(search.index_post, instance.pk, unique=True)
+    scopes = post_scopes(instance)
+    previous_group = getattr(instance, '_previous_group_slug', None)
+    if previous_group is not None:
+        scopes.append(group_scope(previous_group))
+    bump_generations(scopes)
+    # Счётчик и поколения кэша меняются сразу: это один UPDATE и
+    # инкремент в кэше, а автор должен увидеть запись после редиректа
+    if created:
+        counters.change_stats(instance.author_id, posts_count=1)
+        tasks.enqueue(timeline.fan_out, instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.change_stats(instance.author_id, posts_count=-1)
+    forget_post_card(instance)
+    bump_generations(post_scopes(instance))
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_comment_count(instance.post_id, 1)
+        bump_post_feeds(instance.post_id)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.change_comment_count(instance.post_id, -1)
+    bump_post_feeds(instance.post_id)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_stats(instance.author_id, followers_count=1)
+        counters.change_stats(instance.user_id, following_count=1)
+        timeline.backfill(instance.user_id, instance.author_id)
+        bump_profiles(instance.author_id, instance.user_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.change_stats(instance.author_id, followers_count=-1)
+    counters.change_stats(instance.user_id, following_count=-1)
+    timeline.trim(instance.user_id, instance.author_id)
+    if AuthorStats.objects.filter(
+            user_id=instance.author_id,
+            followers_count=settings.TIMELINE_FANOUT_MAX_FOLLOWERS).exists():
+        # Автор только что вернулся к раскладке по лентам
+        tasks.enqueue(timeline.rejoin, instance.author_id, unique=True)
+    bump_profiles(instance.author_id, instance.user_id)
+
+
+@receiver(collect_metrics)
+def task_backlog(sender, registry, **kwargs):
+    by_status = dict.fromkeys((status for status, _ in Task.STATUSES), 0)
+    for (_, status), count in tasks.backlog().items():
+        by_status[status] += count
+    for status, count in by_status.items():
+        registry.set('yatube_tasks', {'status': status}, count)
+    registry.set('yatube_task_lag_seconds', {}, tasks.lag())
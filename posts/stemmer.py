@@ -0,0 +1,112 @@
+"""
+Стеммер Портера (Snowball) для русского языка.
+
+Отрезает от слова окончания и суффиксы, чтобы разные формы слова
+(«котики», «котиков», «котику») давали одну основу. Алгоритм описан на
+https://snowballstem.org/algorithms/russian/stemmer.html. Все шаги, кроме
+третьего, отрезают окончания только в области RV после первой гласной,
+третий — в области R2.
+"""
+VOWELS = 'аеиоуыэюя'
+
+
+def _endings(after_a_ya='', other=''):
+    """Окончания группы: {окончание: нужна ли перед ним «а» или «я»}."""
+    endings = dict.fromkeys(other.split(), False)
+    endings.update(dict.fromkeys(after_a_ya.split(), True))
+    return endings
+
+
+PERFECTIVE_GERUND = _endings(
+    'в вши вшись',
+    'ив ивши ившись ыв ывши ывшись',
+)
+ADJECTIVE = _endings(
+    other='ее ие ые ое ими ыми ей ий ый ой ем им ым ом его ого ему ому '
+          'их ых ую юю ая яя ою ею',
+)
+PARTICIPLE = _endings('ем нн вш ющ щ', 'ивш ывш ующ')
+REFLEXIVE = _endings(other='ся сь')
+VERB = _endings(
+    'ла на ете йте ли й л ем н ло но ет ют ны ть ешь нно',
+    'ила ыла ена ейте уйте ите или ыли ей уй ил ыл им ым ен ило ыло ено '
+    'ят ует уют ит ыт ены ить ыть ишь ую ю',
+)
+NOUN = _endings(
+    other='а ев ов ие ье е иями ями ами еи ии и ией ей ой ий й иям ям ием '
+          'ем ам ом о у ах иях ях ы ь ию ью ю ия ья я',
+)
+DERIVATIONAL = _endings(other='ост ость')
+SUPERLATIVE = _endings(other='ейш ейше')
+
+
+def _regions(word):
+    """Начала областей RV и R2."""
+    rv = next((i + 1 for i, char in enumerate(word) if char in VOWELS),
+              len(word))
+
+    def after_vowel_consonant(start):
+        for i in range(start + 1, len(word)):
+            if word[i - 1] in VOWELS and word[i] not in VOWELS:
+                return i + 1
+        return len(word)
+
+    r2 = after_vowel_consonant(after_vowel_consonant(0))
+    return rv, r2
+
+
+def _strip(word, start, endings):
+    """
+    Отрезает самое длинное окончание группы, лежащее в word[start:].
+    Возвращает новое слово или None, если окончание не подошло.
+    """
+    for length in range(min(len(word) - start, 6), 0, -1):
+        ending = word[-length:]
+        if ending not in endings:
+            continue
+        if endings[ending]:
+            # Окончание отрезается, а «а»/«я» перед ним остаётся
+            if (len(word) - length - 1 < start
+                    or word[-length - 1] not in 'ая'):
+                return None
+        return word[:-length]
+    return None
+
+
+def stem(word):
+    """Основа слова в нижнем регистре."""
+    word = word.lower().replace('ё', 'е')
+    rv, r2 = _regions(word)
+
+    # Шаг 1: деепричастие, иначе возвратная частица и затем
+    # прилагательное (с причастием), глагол или существительное
+    stripped = _strip(word, rv, PERFECTIVE_GERUND)
+    if stripped is not None:
+        word = stripped
+    else:
+        word = _strip(word, rv, REFLEXIVE) or word
+        adjective = _strip(word, rv, ADJECTIVE)
+        if adjective is not None:
+            word = _strip(adjective, rv, PARTICIPLE) or adjective
+        else:
+            word = (_strip(word, rv, VERB)
+                    or _strip(word, rv, NOUN)
+                    or word)
+
+    # Шаг 2
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Шаг 3: словообразовательный суффикс целиком в R2
+    word = _strip(word, r2, DERIVATIONAL) or word
+
+    # Шаг 4: превосходная степень, двойное «н», мягкий знак
+    superlative = _strip(word, rv, SUPERLATIVE)
+    if superlative is not None:
+        word = superlative
+    if word.endswith('нн') and len(word) - 2 >= rv:
+        word = word[:-1]
+    elif (superlative is None and word.endswith('ь')
+            and len(word) - 1 >= rv):
+        word = word[:-1]
+    return word
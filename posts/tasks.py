@@ -0,0 +1,153 @@
+"""
+Фоновая очередь задач в базе данных.
+
+Побочные эффекты записи, стоимость которых растёт с данными (раскладка
+по лентам подписчиков, индекс поиска, миниатюры), не выполняются в
+запросе. ``enqueue`` кладёт строку Task в той же транзакции, что и
+саму запись: задача появляется, только если запись сохранилась, и не
+теряется при падении процесса. Отдельный процесс ``run_tasks`` забирает
+задачи и выполняет их; упавшая задача повторяется с растущей паузой
+до TASK_MAX_ATTEMPTS раз, после чего остаётся в состоянии failed.
+
+Очередь видна в админке, в ``run_tasks --stats`` и в /metrics.
+
+При TASKS_EAGER (режим разработки и тесты) задачи выполняются сразу
+при постановке, в отдельной точке сохранения.
+"""
+import json
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from yatube.metrics import unmeasured
+from yatube.routers import use_primary
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+# Имя задачи -> функция
+TASKS = {}
+
+
+def task(func):
+    """Регистрирует функцию уровня модуля как задачу очереди."""
+    func.task_name = f'{func.__module__}.{func.__name__}'
+    TASKS[func.task_name] = func
+    return func
+
+
+def enqueue(func, *args, unique=False):
+    """
+    Ставит вызов ``func(*args)`` в очередь. С ``unique`` не ставит его,
+    если такой же вызов уже ждёт выполнения.
+    """
+    if settings.TASKS_EAGER:
+        _run_eagerly(func, args)
+        return
+    arguments = json.dumps(args)
+    if unique and Task.objects.filter(
+            name=func.task_name, args=arguments,
+            status=Task.PENDING).exists():
+        return
+    Task.objects.create(name=func.task_name, args=arguments)
+
+
+def _run_eagerly(func, args):
+    # Ошибка задачи откатывает только её точку сохранения, а не запрос,
+    # и, как в воркере, не доходит до пользователя
+    try:
+        with unmeasured(), use_primary(), transaction.atomic():
+            func(*args)
+    except Exception:
+        logger.exception('Задача %s%s не выполнена', func.task_name, args)
+
+
+def _resolve(name):
+    if name not in TASKS:
+        # Модуль задачи мог ещё не импортироваться в этом процессе
+        import_string(name)
+    return TASKS[name]
+
+
+def _available(now):
+    return (Q(status=Task.PENDING, run_at__lte=now)
+            | Q(status=Task.RUNNING, locked_until__lt=now))
+
+
+def claim(limit):
+    """
+    Забирает до limit готовых задач. Задача достаётся только одному
+    воркеру: условное UPDATE меняет строку, лишь пока её никто не взял.
+    """
+    now = timezone.now()
+    claimed = []
+    candidates = (Task.objects.filter(_available(now))
+                  .values_list('pk', flat=True)[:limit])
+    for pk in list(candidates):
+        taken = Task.objects.filter(_available(now), pk=pk).update(
+            status=Task.RUNNING,
+            locked_until=now + timedelta(seconds=settings.TASK_LEASE),
+            attempts=F('attempts') + 1,
+        )
+        if taken:
+            claimed.append(Task.objects.get(pk=pk))
+    return claimed
+
+
+def execute(job):
+    """Выполняет взятую задачу; возвращает True при успехе."""
+    try:
+        func = _resolve(job.name)
+        # Задача читает только что записанное — реплики могут отставать
+        with use_primary(), transaction.atomic():
+            func(*json.loads(job.args))
+    except Exception:
+        logger.exception('Задача %s не выполнена (попытка %s)',
+                         job, job.attempts)
+        job.last_error = traceback.format_exc()
+        if job.attempts >= settings.TASK_MAX_ATTEMPTS:
+            job.status = Task.FAILED
+        else:
+            job.status = Task.PENDING
+            delay = settings.TASK_RETRY_DELAY * 2 ** (job.attempts - 1)
+            job.run_at = timezone.now() + timedelta(seconds=delay)
+        job.locked_until = None
+        job.save(update_fields=['status', 'run_at', 'locked_until',
+                                'last_error'])
+        return False
+    job.delete()
+    return True
+
+
+def run_pending(limit=100):
+    """Выполняет готовые задачи пачкой; возвращает (успешно, с ошибкой)."""
+    done = failed = 0
+    for job in claim(limit):
+        if execute(job):
+            done += 1
+        else:
+            failed += 1
+    return done, failed
+
+
+def backlog():
+    """Число задач по имени и состоянию."""
+    return {
+        (name, status): count
+        for name, status, count in Task.objects.order_by()
+        .values_list('name', 'status').annotate(Count('pk'))
+    }
+
+
+def lag():
+    """Сколько секунд ждёт самая старая готовая к выполнению задача."""
+    oldest = Task.objects.filter(
+        status=Task.PENDING, run_at__lte=timezone.now(),
+    ).aggregate(oldest=Min('run_at'))['oldest']
+    return (timezone.now() - oldest).total_seconds() if oldest else 0
@@ -0,0 +1,56 @@
+from django import template
+from django.conf import settings
+
+from ..thumbnails import default_rendition, find_rendition, rendition_name
+
+register = template.Library()
+
+MIME_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'GIF': 'image/gif',
+    'WEBP': 'image/webp',
+}
+
+
+def _rendition(post, rendition):
+    prefetched = getattr(post, 'renditions', {})
+    if rendition in prefetched:
+        return prefetched[rendition]
+    return find_rendition(post.image, rendition)
+
+
+@register.simple_tag
+def post_thumbnail(post, rendition=None):
+    """
+    Готовая миниатюра картинки записи или None, если её ещё создают.
+    Миниатюры ставятся в очередь только при сохранении записи: показ
+    страницы ничего не пишет и не повторяет упавшие задачи.
+    """
+    if not post.image:
+        return None
+    return _rendition(post, rendition or default_rendition())
+
+
+@register.simple_tag
+def post_picture(post):
+    """
+    Данные для <picture>: запасная миниатюра для <img src> и srcset
+    по каждому формату. None, пока запасная миниатюра не готова.
+    """
+    fallback = post_thumbnail(post)
+    if fallback is None:
+        return None
+    sources = []
+    for image_format in settings.POST_IMAGE_FORMATS:
+        candidates = []
+        for width in settings.POST_IMAGE_WIDTHS:
+            image = _rendition(post, rendition_name(width, image_format))
+            if image is not None:
+                candidates.append(f'{image.url} {width}w')
+        if candidates:
+            sources.append({
+                'type': MIME_TYPES[image_format],
+                'srcset': ', '.join(candidates),
+            })
+    return {'src': fallback, 'sources': sources}
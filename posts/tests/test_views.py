@@ -1,14 +1,36 @@
+import json
 import shutil
 import tempfile
+import threading
+from io import StringIO
+from unittest import skipUnless
 
 from django import forms
 from django.conf import settings
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.core.management import call_command
+from django.core.paginator import Paginator
+from django.db import connection
+from django.template.loader import render_to_string
+from django.contrib.auth.models import AnonymousUser
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from posts.models import Comment, Follow, Group, Post, User
-from yatube.settings import RECORDS_ON_THE_PAGE
+from django.utils import timezone
+from posts.cache import (FEED_LEASE_KEY, INDEX_SCOPE, author_scope,
+                         bump_generations, feed_page_key, get_generations,
+                         group_scope, post_card_key)
+from posts.models import (AuthorStats, Comment, Follow, Group, Post,
+                          PostTerm, Task, TimelineEntry, User)
+from posts.paginator import add_page_window, page_window
+from posts.stemmer import stem
+from posts.tasks import enqueue, run_pending, task
+from posts.thumbnails import (default_rendition, find_rendition,
+                              generate_renditions, schedule_renditions)
+from posts.warmup import hot_urls, warm
+from yatube.metrics import registry
+from yatube.settings import COMMENTS_ON_THE_PAGE, RECORDS_ON_THE_PAGE
 
 
 class PostPagesTests(TestCase):
@@ -143,23 +165,28 @@ class PostPagesTests(TestCase):
         self.assertEqual(response.context.get('user_post_count'), 1)
 
     def test_cache_index_page_show_correct_context(self):
-        # Получаем контент страницы
+        # Миниатюры готовы заранее: их создание обновило бы ленту
+        generate_renditions(PostPagesTests.post_id)
+        # Повторный запрос отдаётся из кэша без рендеринга шаблона
         response_before = self.authorized_client.get(reverse('posts:index'))
-        page_before_clear_cache = response_before.content
-        # Меняем пост в БД
+        page_before_update = response_before.content
+        response_cached = self.authorized_client.get(reverse('posts:index'))
+        self.assertIsNone(response_cached.context)
+        self.assertEqual(page_before_update, response_cached.content)
+        # После изменения поста страница обновляется сразу
         post = Post.objects.latest('id')
         post.text = 'Upd ' + post.text
         post.save()
-        # Получаем контент страницы после обновления
-        response_before = self.authorized_client.get(reverse('posts:index'))
-        page_before_clear_cache_refresh = response_before.content
-        self.assertEqual(page_before_clear_cache,
-                         page_before_clear_cache_refresh)
-        # После очистки кэша страницы будут отличатся
-        cache.clear()
         response_after = self.authorized_client.get(reverse('posts:index'))
-        page_after_clear_cache = response_after.content
-        self.assertNotEqual(page_before_clear_cache, page_after_clear_cache)
+        self.assertIsNotNone(response_after.context)
+        self.assertNotEqual(page_before_update, response_after.content)
+
+    def test_cache_index_page_is_rendered_per_user(self):
+        """Закэшированная страница не показывается другому пользователю"""
+        self.authorized_client.get(reverse('posts:index'))
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertIsNotNone(response.context)
+        self.assertNotContains(response, 'testusername.')
 
 
 class PaginatorViewsTest(TestCase):
@@ -213,6 +240,47 @@ class PaginatorViewsTest(TestCase):
         self.assertEqual(page_objects,
                          PaginatorViewsTest.first_page_object_list)
 
+    def test_cursor_pages_follow_each_other(self):
+        """Курсоры ведут на соседние страницы без OFFSET"""
+        response = self.authorized_client.get(reverse('posts:index'))
+        first_page = response.context.get('page')
+        response = self.authorized_client.get(
+            reverse('posts:index') + f'?after={first_page.next_cursor}')
+        second_page = response.context.get('page')
+        self.assertTrue(second_page.is_cursor)
+        self.assertEqual(len(second_page), PaginatorViewsTest.extra)
+        self.assertFalse(second_page.has_next())
+        self.assertTrue(second_page.has_previous())
+        response = self.authorized_client.get(
+            reverse('posts:index') + f'?before={second_page.previous_cursor}')
+        self.assertEqual(list(response.context.get('page')),
+                         list(first_page))
+
+    def test_broken_cursor_shows_first_page(self):
+        """Испорченный курсор показывает первую страницу"""
+        response = self.authorized_client.get(
+            reverse('posts:index') + '?after=broken')
+        page_objects = list(response.context.get('page'))[::-1]
+        self.assertEqual(page_objects,
+                         PaginatorViewsTest.first_page_object_list)
+
+    def test_page_numbers_are_windowed(self):
+        """Навигация показывает окно номеров, а не все страницы"""
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertEqual(response.context.get('page').page_window, [1, 2])
+        self.assertEqual(
+            page_window(500, 1000),
+            [1, 2, None, 497, 498, 499, 500, 501, 502, 503, None, 999, 1000])
+
+        num_pages = 10 ** 6
+        paginator = Paginator(range(num_pages), 1)
+        html = render_to_string('includes/paginator.html', {
+            'page': add_page_window(paginator.page(num_pages // 2)),
+        })
+        self.assertIn(f'page={num_pages}"', html)
+        self.assertEqual(html.count('&hellip;'), 2)
+        self.assertLess(len(html), 5000)
+
 
 class FollowTests(TestCase):
     @classmethod
@@ -337,3 +405,1152 @@ class FollowTests(TestCase):
             }), data=form_data, follow=True, )
         comments_count_after = Comment.objects.count()
         self.assertEqual(comments_count_before + 1, comments_count_after)
+
+
+class FeedQueriesTests(TestCase):
+    """Число запросов к БД на страницах лент не зависит от числа записей."""
+    # Бюджет запросов на страницу ленты: сессия, пользователь, записи,
+    # счётчики паджинатора и карточки автора.
+    QUERY_BUDGETS = {
+        'index': 4,
+        'group': 5,
+        'profile': 6,
+        'follow': 5,
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(
+            username='testusername',
+            email='testusername@testmail.com',
+        )
+        cls.author = User.objects.create(
+            username='testauthor',
+            email='testauthor@testmail.com',
+        )
+        cls.group = Group.objects.create(
+            title='Тестовое сообщество',
+            slug='test-slug',
+            description='test description'
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+        for post_number in range(RECORDS_ON_THE_PAGE * 2):
+            post = Post.objects.create(
+                text=f'{post_number}. Заголовок тестовой записи',
+                author=cls.author,
+                group=cls.group,
+            )
+            Comment.objects.create(
+                post=post,
+                author=cls.user,
+                text='Тестовый комментарий',
+            )
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(FeedQueriesTests.user)
+        cache.clear()
+
+    def test_feed_pages_fit_query_budget(self):
+        """Страницы лент укладываются в бюджет запросов к БД."""
+        pages = {
+            'index': reverse('posts:index'),
+            'group': reverse('posts:blogs', kwargs={'slug': 'test-slug'}),
+            'profile': reverse('posts:profile',
+                               kwargs={'username': 'testauthor'}),
+            'follow': reverse('posts:follow_index'),
+        }
+        for name, url in pages.items():
+            with self.subTest(page=name):
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.authorized_client.get(url)
+                self.assertEqual(len(response.context.get('page')),
+                                 RECORDS_ON_THE_PAGE)
+                self.assertLessEqual(len(queries),
+                                     FeedQueriesTests.QUERY_BUDGETS[name])
+
+    def test_feed_posts_have_comment_count(self):
+        """Количество комментариев приходит вместе с записями ленты."""
+        response = self.authorized_client.get(reverse('posts:index'))
+        for post in response.context.get('page'):
+            self.assertEqual(post.comment_count, 1)
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(
+            username='testusername',
+            email='testusername@testmail.com',
+        )
+        cls.author = User.objects.create(
+            username='testauthor',
+            email='testauthor@testmail.com',
+        )
+        cls.old_post = Post.objects.create(
+            text='Запись до подписки',
+            author=cls.author,
+        )
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(TimelineTests.user)
+        cache.clear()
+
+    def follow_page_posts(self):
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        return list(response.context.get('page'))
+
+    def test_follow_backfills_and_unfollow_trims_timeline(self):
+        """Подписка заполняет ленту, отписка её очищает"""
+        response = self.authorized_client.get(
+            reverse('posts:profile_follow',
+                    kwargs={'username': TimelineTests.author.username}))
+        # Подписавшийся сразу читает основную базу, а не реплику
+        self.assertIn('pin_primary', response.cookies)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=TimelineTests.user, post=TimelineTests.old_post).exists())
+        self.assertEqual(self.follow_page_posts(), [TimelineTests.old_post])
+
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow',
+                    kwargs={'username': TimelineTests.author.username}))
+        self.assertFalse(TimelineEntry.objects.filter(
+            user=TimelineTests.user).exists())
+        self.assertEqual(self.follow_page_posts(), [])
+
+    def test_new_post_is_fanned_out_to_followers(self):
+        """Новая запись раскладывается по лентам подписчиков"""
+        Follow.objects.create(user=TimelineTests.user,
+                              author=TimelineTests.author)
+        post = Post.objects.create(text='Новая запись',
+                                   author=TimelineTests.author)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=TimelineTests.user, post=post).exists())
+        self.assertEqual(self.follow_page_posts()[0], post)
+
+    @override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=0)
+    def test_popular_author_is_merged_on_read(self):
+        """Записи популярных авторов подмешиваются при чтении ленты"""
+        Follow.objects.create(user=TimelineTests.user,
+                              author=TimelineTests.author)
+        post = Post.objects.create(text='Новая запись',
+                                   author=TimelineTests.author)
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.follow_page_posts(),
+                         [post, TimelineTests.old_post])
+
+    @override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=1)
+    def test_author_returning_to_fan_out_keeps_posts(self):
+        """Записи автора остаются в ленте, когда он снова раскладывается"""
+        other = User.objects.create(username='other')
+        Follow.objects.create(user=TimelineTests.user,
+                              author=TimelineTests.author)
+        Follow.objects.create(user=other, author=TimelineTests.author)
+        post = Post.objects.create(text='Запись популярного автора',
+                                   author=TimelineTests.author)
+        self.assertEqual(self.follow_page_posts(),
+                         [post, TimelineTests.old_post])
+        Follow.objects.filter(user=other).delete()
+        self.assertEqual(self.follow_page_posts(),
+                         [post, TimelineTests.old_post])
+
+
+class CountersTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(
+            username='testusername',
+            email='testusername@testmail.com',
+        )
+        cls.author = User.objects.create(
+            username='testauthor',
+            email='testauthor@testmail.com',
+        )
+        cls.post = Post.objects.create(
+            text='Заголовок тестовой записи',
+            author=cls.author,
+        )
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(CountersTests.user)
+        cache.clear()
+
+    def test_counters_follow_create_and_delete(self):
+        """Счётчики меняются вместе с записями, комментариями и подписками"""
+        self.authorized_client.get(
+            reverse('posts:profile_follow',
+                    kwargs={'username': CountersTests.author.username}))
+        self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={
+                'username': CountersTests.author.username,
+                'post_id': CountersTests.post.id,
+            }), data={'text': 'Комментарий'})
+        author_stats = AuthorStats.objects.get(user=CountersTests.author)
+        user_stats = AuthorStats.objects.get(user=CountersTests.user)
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertEqual(author_stats.followers_count, 1)
+        self.assertEqual(user_stats.following_count, 1)
+        self.assertEqual(
+            Post.objects.get(pk=CountersTests.post.id).comment_count, 1)
+
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow',
+                    kwargs={'username': CountersTests.author.username}))
+        Comment.objects.all().delete()
+        author_stats.refresh_from_db()
+        user_stats.refresh_from_db()
+        self.assertEqual(author_stats.followers_count, 0)
+        self.assertEqual(user_stats.following_count, 0)
+        self.assertEqual(
+            Post.objects.get(pk=CountersTests.post.id).comment_count, 0)
+
+    def test_recount_counters_repairs_drift(self):
+        """Команда recount_counters исправляет расхождения счётчиков"""
+        Follow.objects.create(user=CountersTests.user,
+                              author=CountersTests.author)
+        AuthorStats.objects.update(posts_count=42, followers_count=42)
+        Post.objects.update(comment_count=42)
+        call_command('recount_counters', stdout=StringIO())
+        author_stats = AuthorStats.objects.get(user=CountersTests.author)
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertEqual(author_stats.followers_count, 1)
+        self.assertEqual(
+            Post.objects.get(pk=CountersTests.post.id).comment_count, 0)
+
+    def test_profile_shows_counters(self):
+        """Карточка автора берёт значения из счётчиков"""
+        response = self.authorized_client.get(
+            reverse('posts:profile',
+                    kwargs={'username': CountersTests.author.username}))
+        self.assertEqual(response.context.get('user_post_count'), 1)
+        self.assertEqual(
+            response.context.get('author_stats').followers_count, 0)
+
+
+class PostCardCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(
+            username='testauthor',
+            email='testauthor@testmail.com',
+        )
+        cls.reader = User.objects.create(
+            username='testreader',
+            email='testreader@testmail.com',
+        )
+
+    def setUp(self):
+        self.author_client = Client()
+        self.author_client.force_login(PostCardCacheTests.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(PostCardCacheTests.reader)
+        self.post = Post.objects.create(
+            text='Заголовок тестовой записи',
+            author=PostCardCacheTests.author,
+        )
+        self.profile_url = reverse(
+            'posts:profile', kwargs={'username': 'testauthor'})
+        cache.clear()
+
+    def test_card_is_cached_and_invalidated_on_save(self):
+        """Карточка берётся из кэша, пока запись не сохранили заново"""
+        self.reader_client.get(self.profile_url)
+        self.assertIsNotNone(cache.get(post_card_key(self.post)))
+        Post.objects.filter(pk=self.post.pk).update(text='Скрытая правка')
+        # Сбрасываем кэш страницы, но не карточки
+        bump_generations([author_scope('testauthor')])
+        response = self.reader_client.get(self.profile_url)
+        self.assertContains(response, 'Заголовок тестовой записи')
+
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Новый текст'
+        post.save()
+        response = self.reader_client.get(self.profile_url)
+        self.assertContains(response, 'Новый текст')
+
+    def test_card_is_invalidated_on_comment(self):
+        """Новый комментарий обновляет счётчик на карточке"""
+        self.reader_client.get(self.profile_url)
+        Comment.objects.create(post=self.post,
+                               author=PostCardCacheTests.reader,
+                               text='Комментарий')
+        response = self.reader_client.get(self.profile_url)
+        self.assertContains(response, 'Комментариев: 1')
+
+    def test_card_is_invalidated_on_rename(self):
+        """Карточка обновляется при переименовании сообщества и автора"""
+        group = Group.objects.create(title='Старое название',
+                                     slug='test-slug',
+                                     description='Описание')
+        self.post.group = group
+        self.post.save()
+        self.reader_client.get(self.profile_url)
+        group.title = 'Новое название'
+        group.save()
+        PostCardCacheTests.author.username = 'renamedauthor'
+        PostCardCacheTests.author.save()
+        # Сбрасываем кэш страницы, но не карточки
+        bump_generations([INDEX_SCOPE])
+        response = self.reader_client.get(reverse('posts:index'))
+        self.assertContains(response, '#Новое название')
+        self.assertContains(response, '@renamedauthor')
+
+    def test_edit_button_is_rendered_per_viewer(self):
+        """Кнопка редактирования не попадает в общий кэш карточки"""
+        edit_url = reverse('posts:post_edit', kwargs={
+            'username': 'testauthor', 'post_id': self.post.pk})
+        response = self.author_client.get(self.profile_url)
+        self.assertContains(response, edit_url)
+        response = self.reader_client.get(self.profile_url)
+        self.assertNotContains(response, edit_url)
+
+    def test_deleted_post_card_is_forgotten(self):
+        """Карточка удалённой записи убирается из кэша"""
+        self.reader_client.get(self.profile_url)
+        key = post_card_key(self.post)
+        self.post.delete()
+        self.assertIsNone(cache.get(key))
+
+
+class PostThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        settings.MEDIA_ROOT = tempfile.mkdtemp(dir=tempfile.gettempdir())
+        cls.user = User.objects.create(
+            username='testusername',
+            email='testusername@testmail.com',
+        )
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        cls.post = Post.objects.create(
+            text='Заголовок тестовой записи',
+            author=cls.user,
+            image=SimpleUploadedFile(name='small.gif', content=small_gif,
+                                     content_type='image/gif'),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.guest_client = Client()
+        self.profile_url = reverse(
+            'posts:profile', kwargs={'username': 'testusername'})
+        cache.clear()
+
+    @override_settings(TASKS_EAGER=False)
+    def test_placeholder_until_renditions_are_ready(self):
+        """Пока миниатюры нет, вместо неё показывается заглушка"""
+        schedule_renditions(PostThumbnailTests.post)
+        response = self.guest_client.get(self.profile_url)
+        self.assertContains(response, 'card-img bg-light')
+        image = PostThumbnailTests.post.image
+        self.assertIsNone(find_rendition(image, default_rendition()))
+        # Показ страницы задач не ставит
+        self.guest_client.get(self.profile_url)
+        self.assertEqual(Task.objects.count(), 1)
+
+        self.assertEqual(run_pending(), (1, 0))
+        rendition = find_rendition(image, default_rendition())
+        self.assertIsNotNone(rendition)
+        response = self.guest_client.get(self.profile_url)
+        self.assertContains(response, rendition.url)
+        self.assertNotContains(response, 'card-img bg-light')
+
+    def test_picture_offers_widths_and_formats(self):
+        """Карточка предлагает браузеру srcset в WebP и JPEG"""
+        generate_renditions(PostThumbnailTests.post.id)
+        response = self.guest_client.get(self.profile_url)
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, '<source type="image/jpeg"')
+        for width in settings.POST_IMAGE_WIDTHS:
+            with self.subTest(width=width):
+                self.assertContains(response, f' {width}w', count=2)
+
+    def test_renditions_are_fetched_once_per_page(self):
+        """Миниатюры страницы ищутся одним запросом к хранилищу sorl"""
+        generate_renditions(PostThumbnailTests.post.id)
+        for number in range(3):
+            post = Post.objects.create(
+                text=f'{number}. Запись с картинкой',
+                author=PostThumbnailTests.user,
+                image=PostThumbnailTests.post.image.name,
+            )
+            generate_renditions(post.id)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest_client.get(self.profile_url)
+        kvstore_queries = [query for query in queries
+                           if 'thumbnail_kvstore' in query['sql']]
+        self.assertEqual(len(kvstore_queries), 1)
+        for post in response.context.get('page'):
+            self.assertIsNotNone(post.renditions[default_rendition()])
+
+    def test_post_page_fetches_renditions_once(self):
+        """Миниатюры страницы записи ищутся одним запросом к хранилищу"""
+        generate_renditions(PostThumbnailTests.post.id)
+        cache.clear()
+        url = reverse('posts:post', kwargs={
+            'username': 'testusername',
+            'post_id': PostThumbnailTests.post.id,
+        })
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest_client.get(url)
+        kvstore_queries = [query for query in queries
+                           if 'thumbnail_kvstore' in query['sql']]
+        self.assertEqual(len(kvstore_queries), 1)
+        self.assertIsNotNone(
+            response.context['post'].renditions[default_rendition()])
+
+    @override_settings(TASKS_EAGER=False)
+    def test_backfill_queues_posts_without_renditions(self):
+        """generate_renditions --missing ставит записи без миниатюр"""
+        with open(PostThumbnailTests.post.image.path, 'rb') as source:
+            ready = Post.objects.create(
+                text='Запись с готовыми миниатюрами',
+                author=PostThumbnailTests.user,
+                image=SimpleUploadedFile(name='ready.gif',
+                                         content=source.read(),
+                                         content_type='image/gif'),
+            )
+        generate_renditions(ready.id)
+        Post.objects.create(text='Без картинки',
+                            author=PostThumbnailTests.user)
+        out = StringIO()
+        call_command('generate_renditions', '--missing', stdout=out)
+        self.assertIn('Поставлено в очередь записей: 1', out.getvalue())
+        renditions = Task.objects.filter(name=generate_renditions.task_name)
+        self.assertEqual(list(renditions.values_list('args', flat=True)),
+                         [json.dumps([PostThumbnailTests.post.id])])
+
+        run_pending()
+        self.assertIsNotNone(find_rendition(PostThumbnailTests.post.image,
+                                            default_rendition()))
+        call_command('generate_renditions', '--missing', stdout=StringIO())
+        self.assertFalse(renditions.exists())
+
+
+class CommentPagesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(
+            username='testauthor',
+            email='testauthor@testmail.com',
+        )
+        cls.post = Post.objects.create(
+            text='Заголовок тестовой записи',
+            author=cls.author,
+        )
+        cls.extra = 5
+        for number in range(COMMENTS_ON_THE_PAGE + cls.extra):
+            commenter = User.objects.create(
+                username=f'commenter{number}',
+                email=f'commenter{number}@testmail.com',
+            )
+            Comment.objects.create(post=cls.post, author=commenter,
+                                   text=f'Комментарий {number}')
+
+    def setUp(self):
+        self.guest_client = Client()
+        self.post_url = reverse('posts:post', kwargs={
+            'username': 'testauthor',
+            'post_id': CommentPagesTests.post.id,
+        })
+        self.comments_url = reverse('posts:post_comments', kwargs={
+            'username': 'testauthor',
+            'post_id': CommentPagesTests.post.id,
+        })
+
+    def test_post_page_shows_first_comments_page(self):
+        """На странице записи только первая страница комментариев"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest_client.get(self.post_url)
+        comments = response.context.get('comments_page')
+        self.assertEqual(len(comments), COMMENTS_ON_THE_PAGE)
+        self.assertEqual(comments[0].text,
+                         f'Комментарий {COMMENTS_ON_THE_PAGE + 4}')
+        self.assertContains(response, 'js-more-comments')
+        # Авторы комментариев приходят тем же запросом
+        self.assertLess(len(queries), 10)
+
+    def test_more_comments_as_html_and_json(self):
+        """Следующая страница отдаётся фрагментом HTML и в JSON"""
+        response = self.guest_client.get(self.post_url)
+        cursor = response.context.get('comments_page').next_cursor
+        response = self.guest_client.get(
+            self.comments_url + f'?after={cursor}')
+        self.assertTemplateUsed(response, 'includes/comment_list.html')
+        self.assertEqual(len(response.context.get('comments')),
+                         CommentPagesTests.extra)
+        self.assertNotContains(response, 'js-more-comments')
+
+        response = self.guest_client.get(
+            self.comments_url + f'?after={cursor}&format=json')
+        data = response.json()
+        self.assertEqual(len(data['comments']), CommentPagesTests.extra)
+        self.assertEqual(data['comments'][-1]['text'], 'Комментарий 0')
+        self.assertIsNone(data['next'])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN есть в SQLite')
+class QueryPlanTests(TestCase):
+    """Запросы страниц читают индексы, а не сканируют и сортируют таблицы."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(
+            username='testusername',
+            email='testusername@testmail.com',
+        )
+        cls.author = User.objects.create(
+            username='testauthor',
+            email='testauthor@testmail.com',
+        )
+        cls.group = Group.objects.create(
+            title='Тестовое сообщество',
+            slug='test-slug',
+            description='test description'
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+        for post_number in range(RECORDS_ON_THE_PAGE * 2):
+            cls.post = Post.objects.create(
+                text=f'{post_number}. Заголовок тестовой записи',
+                author=cls.author,
+                group=cls.group,
+            )
+        for number in range(COMMENTS_ON_THE_PAGE * 2):
+            Comment.objects.create(post=cls.post, author=cls.user,
+                                   text=f'Комментарий {number}')
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(QueryPlanTests.user)
+        cache.clear()
+
+    def assertUsesIndexes(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        selects = [query['sql'] for query in queries
+                   if query['sql'].startswith('SELECT')]
+        self.assertTrue(selects)
+        for sql in selects:
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = [row[-1] for row in cursor.fetchall()]
+            for step in plan:
+                # Полный проход допустим только по индексу, в порядке
+                # которого и выдаётся результат, или по строкам подзапроса,
+                # план которого проверяется здесь же
+                self.assertNotIn('TEMP B-TREE', step, msg=sql)
+                if step.startswith('SCAN') and step != 'SCAN subquery':
+                    self.assertIn('INDEX', step, msg=sql)
+        return response
+
+    def test_feed_queries_use_indexes(self):
+        """Ленты и их курсорные страницы обходятся без сортировки."""
+        pages = {
+            'index': reverse('posts:index'),
+            'group': reverse('posts:blogs', kwargs={'slug': 'test-slug'}),
+            'profile': reverse('posts:profile',
+                               kwargs={'username': 'testauthor'}),
+            'follow': reverse('posts:follow_index'),
+        }
+        for name, url in pages.items():
+            with self.subTest(page=name):
+                response = self.assertUsesIndexes(url)
+                cursor = response.context.get('page').next_cursor
+                self.assertUsesIndexes(f'{url}?after={cursor}')
+
+    def test_comment_queries_use_indexes(self):
+        """Комментарии записи читаются по индексу (post, created)."""
+        kwargs = {'username': 'testauthor',
+                  'post_id': QueryPlanTests.post.id}
+        response = self.assertUsesIndexes(reverse('posts:post',
+                                                  kwargs=kwargs))
+        cursor = response.context.get('comments_page').next_cursor
+        self.assertUsesIndexes(
+            reverse('posts:post_comments', kwargs=kwargs)
+            + f'?after={cursor}')
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(
+            username='testauthor',
+            email='testauthor@testmail.com',
+        )
+        cls.cats = Post.objects.create(
+            text='Мои котики любят спать. Котики, котики!',
+            author=cls.author,
+        )
+        cls.cats_and_dogs = Post.objects.create(
+            text='Про котиков и собак написано много',
+            author=cls.author,
+        )
+        cls.dogs = Post.objects.create(
+            text='Собаки лают',
+            author=cls.author,
+        )
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def search(self, query):
+        response = self.guest_client.get(reverse('posts:search'),
+                                         {'q': query})
+        return list(response.context.get('page'))
+
+    def test_stemmer_joins_word_forms(self):
+        """Формы одного слова сводятся к одной основе"""
+        self.assertEqual({stem(word) for word in
+                          ('котики', 'котиков', 'котику', 'котиком')},
+                         {'котик'})
+        self.assertEqual(stem('нежность'), 'нежност')
+        self.assertEqual(stem('красивейший'), 'красив')
+
+    def test_search_ranks_posts_with_all_words(self):
+        """Найдены записи со всеми словами, чаще упомянутое — выше"""
+        self.assertEqual(self.search('котик'),
+                         [SearchTests.cats, SearchTests.cats_and_dogs])
+        self.assertEqual(self.search('котики собака'),
+                         [SearchTests.cats_and_dogs])
+        self.assertEqual(self.search('жирафы'), [])
+        self.assertEqual(self.search(''), [])
+
+    def test_index_follows_post_changes(self):
+        """Индекс обновляется при правке и удалении записи"""
+        post = SearchTests.dogs
+        post.text = 'Жирафы высокие'
+        post.save()
+        self.assertEqual(self.search('собаки'),
+                         [SearchTests.cats_and_dogs])
+        self.assertEqual(self.search('жираф'), [post])
+        post.delete()
+        self.assertFalse(PostTerm.objects.filter(term='жираф').exists())
+
+    def test_pages_keep_query(self):
+        """Ссылки на страницы результатов сохраняют запрос"""
+        for number in range(RECORDS_ON_THE_PAGE):
+            Post.objects.create(text=f'Котик номер {number}',
+                                author=SearchTests.author)
+        response = self.guest_client.get(reverse('posts:search'),
+                                         {'q': 'котик'})
+        self.assertContains(response, '?q=%D0%BA%D0%BE%D1%82%D0%B8%D0%BA'
+                                      '&amp;page=2')
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке находит записи по основам слов"""
+        admin = User.objects.create_superuser(
+            'admin', 'admin@testmail.com', 'password')
+        client = Client()
+        client.force_login(admin)
+        response = client.get('/admin/posts/post/', {'q': 'котиков'})
+        self.assertEqual(
+            set(response.context['cl'].result_list),
+            {SearchTests.cats, SearchTests.cats_and_dogs},
+        )
+
+
+class DataTransferTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(
+            username='testusername',
+            email='testusername@testmail.com',
+        )
+        cls.author = User.objects.create(
+            username='testauthor',
+            email='testauthor@testmail.com',
+        )
+        cls.group = Group.objects.create(
+            title='Тестовое сообщество',
+            slug='test-slug',
+            description='test description'
+        )
+        cls.post = Post.objects.create(
+            text='Котики спят',
+            author=cls.author,
+            group=cls.group,
+        )
+        Comment.objects.create(post=cls.post, author=cls.user,
+                               text='Тестовый комментарий')
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def export(self, name, *args):
+        path = f'{self.directory}/{name}'
+        call_command('export_data', '--output', path, *args)
+        return path
+
+    def test_export_and_import_restore_data(self):
+        """Выгрузка и загрузка переносят данные и производные от них"""
+        path = self.export('dump.jsonl')
+        pub_date = DataTransferTests.post.pub_date
+        Group.objects.all().delete()
+        User.objects.all().delete()
+        call_command('import_data', path, stdout=StringIO())
+
+        post = Post.objects.select_related('author', 'group').get()
+        self.assertEqual(post.author.username, 'testauthor')
+        self.assertEqual(post.group.slug, 'test-slug')
+        self.assertEqual(post.pub_date, pub_date)
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(post.author.stats.followers_count, 1)
+        self.assertTrue(Follow.objects.filter(
+            user__username='testusername', author=post.author).exists())
+        self.assertTrue(TimelineEntry.objects.filter(post=post).exists())
+        self.assertTrue(PostTerm.objects.filter(post=post,
+                                                term='котик').exists())
+
+        # Повторная загрузка не создаёт дублей
+        call_command('import_data', path, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertEqual(Comment.objects.count(), 1)
+
+    def test_import_remaps_taken_ids(self):
+        """Запись с занятым id получает новый, комментарии идут за ней"""
+        path = self.export('dump.jsonl')
+        post_id = DataTransferTests.post.id
+        Post.objects.all().delete()
+        other = Post.objects.create(id=post_id, text='Чужая запись',
+                                    author=DataTransferTests.user)
+        call_command('import_data', path, stdout=StringIO())
+
+        post = Post.objects.get(text='Котики спят')
+        self.assertNotEqual(post.id, post_id)
+        self.assertEqual(post.comments.get().text, 'Тестовый комментарий')
+        self.assertFalse(other.comments.exists())
+        # Повторная загрузка находит уже перенесённую запись
+        call_command('import_data', path, stdout=StringIO())
+        self.assertEqual(Post.objects.filter(text='Котики спят').count(), 1)
+
+    def test_csv_import_in_batches(self):
+        """CSV одной модели загружается пачками"""
+        path = f'{self.directory}/posts.csv'
+        with open(path, 'w', encoding='utf-8') as stream:
+            stream.write('id,author,group,text,pub_date,image\n')
+            for number in range(5):
+                stream.write(f',newauthor,test-slug,Запись {number},,\n')
+        call_command('import_data', path, '--model', 'post',
+                     '--batch-size', '2', stdout=StringIO())
+        self.assertEqual(
+            Post.objects.filter(author__username='newauthor').count(), 5)
+        self.assertEqual(User.objects.get(
+            username='newauthor').stats.posts_count, 5)
+
+
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_generated_dataset_is_consistent(self):
+        """Сгенерированные данные согласованы с лентами и счётчиками"""
+        call_command('generate_dataset', '--users', '20', '--groups', '2',
+                     '--posts', '50', '--comments', '40', '--follows', '3',
+                     stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 50)
+        self.assertEqual(Comment.objects.count(), 40)
+        follow = Follow.objects.select_related('author__stats').first()
+        self.assertEqual(TimelineEntry.objects.filter(
+            user=follow.user, post__author=follow.author).count(),
+            min(follow.author.stats.posts_count, settings.TIMELINE_BACKFILL))
+        self.assertFalse(Post.objects.exclude(
+            comment_count=0).filter(comments__isnull=True).exists())
+
+    def test_benchmark_saves_result(self):
+        """Замер проходит по всем сценариям и сохраняет результат"""
+        call_command('generate_dataset', '--users', '10', '--posts', '30',
+                     '--comments', '10', '--follows', '3', stdout=StringIO())
+        path = f'{self.directory}/results.jsonl'
+        with override_settings(BENCHMARK_RESULTS_FILE=path):
+            call_command('benchmark_views', '--requests', '2',
+                         stdout=StringIO())
+            call_command('benchmark_views', '--requests', '2',
+                         '--only', 'index', stdout=StringIO())
+        with open(path, encoding='utf-8') as stream:
+            first, second = [json.loads(line) for line in stream]
+        self.assertIn('follow_index', first['scenarios'])
+        self.assertEqual(list(second['scenarios']), ['index'])
+        self.assertGreater(first['scenarios']['index']['queries_mean'], 0)
+        self.assertFalse(User.objects.filter(
+            username='benchmark-views').exists())
+
+
+@task
+def failing_task(message):
+    raise RuntimeError(message)
+
+
+@override_settings(TASKS_EAGER=False)
+class TaskQueueTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='testauthor')
+        cls.follower = User.objects.create(username='testfollower')
+        Follow.objects.create(user=cls.follower, author=cls.author)
+
+    def test_post_side_effects_run_in_background(self):
+        """Раскладка по лентам и индекс поиска выполняются воркером"""
+        client = Client()
+        client.force_login(TaskQueueTests.author)
+        client.post(reverse('posts:new_post'), {'text': 'Котики спят'})
+        post = Post.objects.get()
+        # Счётчик автора меняется сразу, остальное ждёт в очереди
+        self.assertEqual(AuthorStats.objects.get(
+            user=TaskQueueTests.author).posts_count, 1)
+        self.assertEqual(Task.objects.count(), 2)
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertFalse(PostTerm.objects.exists())
+
+        call_command('run_tasks', '--once', stdout=StringIO())
+        self.assertFalse(Task.objects.exists())
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=TaskQueueTests.follower, post=post).exists())
+        self.assertTrue(PostTerm.objects.filter(post=post,
+                                                term='котик').exists())
+
+    @override_settings(TASK_MAX_ATTEMPTS=2)
+    def test_failed_task_is_retried_then_kept(self):
+        """Упавшая задача повторяется с паузой, затем остаётся failed"""
+        enqueue(failing_task, 'сбой')
+        with self.assertLogs('posts.tasks', 'ERROR'):
+            self.assertEqual(run_pending(), (0, 1))
+        job = Task.objects.get()
+        self.assertEqual(job.status, Task.PENDING)
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('RuntimeError: сбой', job.last_error)
+        # До истечения паузы задача не выдаётся
+        self.assertEqual(run_pending(), (0, 0))
+
+        Task.objects.update(run_at=timezone.now())
+        with self.assertLogs('posts.tasks', 'ERROR'):
+            run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Task.FAILED, 2))
+        self.assertEqual(run_pending(), (0, 0))
+
+    def test_abandoned_task_is_taken_again(self):
+        """Задачу упавшего воркера выполняет другой после срока аренды"""
+        post = Post.objects.create(text='Запись', author=TaskQueueTests.author)
+        Task.objects.update(status=Task.RUNNING,
+                            locked_until=timezone.now())
+        self.assertEqual(run_pending(), (2, 0))
+        self.assertTrue(TimelineEntry.objects.filter(post=post).exists())
+
+    def test_backlog_is_observable(self):
+        """Очередь видна в /metrics и в run_tasks --stats"""
+        Post.objects.create(text='Запись', author=TaskQueueTests.author)
+        response = Client().get(reverse('metrics'))
+        self.assertContains(response, 'yatube_tasks{status="pending"} 2')
+        output = StringIO()
+        call_command('run_tasks', '--stats', stdout=output)
+        self.assertIn('posts.timeline.fan_out', output.getvalue())
+
+
+@override_settings(FEED_COUNT_EXACT_LIMIT=3)
+class FeedCountTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='testusername')
+        cls.group = Group.objects.create(title='Сообщество', slug='slug')
+        for number in range(5):
+            Post.objects.create(text=f'Запись {number}', author=cls.user,
+                                group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_count(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        paginator = response.context['paginator']
+        self.assertIs(type(paginator), Paginator)
+        counts = [query['sql'] for query in queries
+                  if 'COUNT(' in query['sql']]
+        return paginator.count, counts
+
+    def test_large_feed_count_is_cached(self):
+        """Большая лента считается один раз за срок кэша"""
+        url = reverse('posts:blogs', kwargs={'slug': 'slug'})
+        count, queries = self.get_count(url)
+        self.assertEqual(count, 5)
+        Post.objects.create(text='Новая', author=FeedCountTests.user,
+                            group=FeedCountTests.group)
+        count, queries = self.get_count(url)
+        self.assertEqual(count, 5)
+        # Только ограниченный подсчёт, без полного COUNT(*)
+        self.assertTrue(all('LIMIT' in sql for sql in queries))
+
+    def test_small_feed_count_is_exact(self):
+        """Небольшая лента считается точно при каждом запросе"""
+        Post.objects.filter(pk__in=Post.objects.values('pk')[:3]).delete()
+        url = reverse('posts:blogs', kwargs={'slug': 'slug'})
+        self.assertEqual(self.get_count(url)[0], 2)
+        Post.objects.create(text='Новая', author=FeedCountTests.user,
+                            group=FeedCountTests.group)
+        self.assertEqual(self.get_count(url)[0], 3)
+
+    @override_settings(FEED_COUNT_EXACT_LIMIT=5)
+    def test_overestimated_count_does_not_break_last_page(self):
+        """Завышенная оценка числа записей не даёт пустых страниц и 500"""
+        for number in range(20):
+            Post.objects.create(text=f'Ещё {number}',
+                                author=FeedCountTests.user)
+        self.client.get(reverse('posts:index'))
+        Post.objects.filter(
+            pk__in=Post.objects.order_by('pk').values('pk')[1:19]).delete()
+        response = self.client.get(reverse('posts:index') + '?page=3')
+        self.assertEqual(response.status_code, 200)
+        page = response.context['page']
+        self.assertEqual(page.paginator.count, 7)
+        self.assertEqual(page.number, 1)
+        self.assertEqual(len(page), 7)
+
+    def test_index_count_is_estimated_and_profile_uses_counter(self):
+        """Общая лента оценивается по ключам, профиль берёт счётчик"""
+        Post.objects.filter(pk=Post.objects.order_by('pk')[1].pk).delete()
+        count, _ = self.get_count(reverse('posts:index'))
+        self.assertEqual(count, 5)
+        count, queries = self.get_count(
+            reverse('posts:profile', kwargs={'username': 'testusername'}))
+        self.assertEqual(count, 4)
+        self.assertEqual(queries, [])
+
+
+@override_settings(FEED_REBUILD_WAIT=0.5, METRICS_SAMPLE_RATE=1)
+class FeedStampedeTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='testusername')
+        cls.group = Group.objects.create(title='Сообщество', slug='slug')
+        Post.objects.create(text='Старая запись', author=cls.user,
+                            group=cls.group)
+        cls.url = reverse('posts:blogs', kwargs={'slug': 'slug'})
+
+    def setUp(self):
+        cache.clear()
+        registry.clear()
+        request = RequestFactory().get(FeedStampedeTests.url)
+        request.user = AnonymousUser()
+        self.key = feed_page_key(request)
+
+    def hold_lease(self):
+        """Пересборку страницы как будто уже начал другой воркер"""
+        cache.add(FEED_LEASE_KEY.format(self.key), 'other', 60)
+
+    def add_post(self):
+        Post.objects.create(text='Новая запись', author=FeedStampedeTests.user,
+                            group=FeedStampedeTests.group)
+
+    def feed_results(self):
+        return {dict(labels)['result']: value
+                for (name, labels), value in registry._values.items()
+                if name == 'yatube_feed_cache_total'}
+
+    def test_stale_page_is_served_during_rebuild(self):
+        """Пока страницу пересобирает другой, отдаётся прежняя копия"""
+        self.client.get(FeedStampedeTests.url)
+        self.add_post()
+        self.hold_lease()
+        response = self.client.get(FeedStampedeTests.url)
+        self.assertIsNone(response.context)
+        self.assertNotContains(response, 'Новая запись')
+        cache.delete(FEED_LEASE_KEY.format(self.key))
+        response = self.client.get(FeedStampedeTests.url)
+        self.assertContains(response, 'Новая запись')
+        self.assertEqual(self.feed_results(),
+                         {'miss': 2, 'stale': 1})
+
+    def test_pinned_user_does_not_get_stale_page(self):
+        """Только что писавший не получает прежнюю копию"""
+        self.client.get(FeedStampedeTests.url)
+        self.add_post()
+        self.hold_lease()
+        self.client.cookies['pin_primary'] = '1'
+        with override_settings(FEED_REBUILD_WAIT=0.1):
+            response = self.client.get(FeedStampedeTests.url)
+        self.assertContains(response, 'Новая запись')
+        # Собранная без аренды страница не сохраняется
+        self.assertEqual(self.feed_results(), {'miss': 2})
+
+    def test_requests_without_copy_wait_for_rebuild(self):
+        """Без прежней копии запрос дожидается чужой пересборки"""
+        self.client.get(FeedStampedeTests.url)
+        stored = cache.get(self.key)
+        cache.delete(self.key)
+        self.hold_lease()
+        generations = get_generations([group_scope('slug')])
+        timer = threading.Timer(
+            0.1, cache.set, (self.key, (generations, stored[1])))
+        timer.start()
+        try:
+            response = self.client.get(FeedStampedeTests.url)
+        finally:
+            timer.join()
+        self.assertIsNone(response.context)
+        self.assertContains(response, 'Старая запись')
+        self.assertEqual(self.feed_results(),
+                         {'miss': 1, 'coalesced': 1})
+
+    def test_fresh_page_is_a_hit(self):
+        """Свежая страница отдаётся из кэша без пересборки"""
+        self.client.get(FeedStampedeTests.url)
+        response = self.client.get(FeedStampedeTests.url)
+        self.assertIsNone(response.context)
+        self.assertEqual(self.feed_results(), {'miss': 1, 'hit': 1})
+
+
+@override_settings(CACHE_WARMUP_PAGES=2, CACHE_WARMUP_GROUPS=1,
+                   CACHE_WARMUP_PROFILES=1)
+class WarmCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='popular')
+        cls.reader = User.objects.create(username='reader')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.group = Group.objects.create(title='Большое', slug='big')
+        Group.objects.create(title='Пустое', slug='empty')
+        for number in range(RECORDS_ON_THE_PAGE + 1):
+            Post.objects.create(text=f'Запись {number}', author=cls.author,
+                                group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_hot_urls(self):
+        """Прогреваются первые страницы самых популярных лент"""
+        expected = []
+        for url in ['/', '/group/big/', '/popular/']:
+            cursor = self.client.get(url).context['page'].next_cursor
+            expected += [url, f'{url}?after={cursor}']
+        self.assertEqual(hot_urls(), expected)
+
+    def test_hot_urls_follow_next_links(self):
+        """Страницы после первой берутся по ссылкам «Следующая»"""
+        with self.settings(CACHE_WARMUP_PAGES=3):
+            urls = [url for url in hot_urls() if url[:2] in ('/', '/?')]
+        self.assertEqual(len(urls), 2)
+        response = self.client.get(urls[0])
+        self.assertContains(response, f'href="{urls[1][1:]}"')
+        response = self.client.get(urls[1])
+        self.assertContains(response, 'Запись 0')
+        self.assertIsNone(response.context['page'].next_cursor)
+
+    def test_warm_cache_fills_feed_cache(self):
+        """После прогрева первые посетители получают страницы из кэша"""
+        out = StringIO()
+        call_command('warm_cache', workers=1, stdout=out)
+        self.assertIn('Прогрето страниц: 6, с ошибкой: 0', out.getvalue())
+        for url in hot_urls():
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIsNone(response.context)
+
+    @override_settings(ALLOWED_HOSTS=['yatube.example'])
+    def test_warm_up_uses_real_host(self):
+        """Прогрев обращается к сайту по имени из ALLOWED_HOSTS"""
+        results = warm(hot_urls(), workers=1)
+        self.assertEqual({status for _, status, _ in results}, {200})
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='testusername')
+        cls.reader = User.objects.create(username='reader')
+        cls.group = Group.objects.create(title='Сообщество', slug='slug')
+        cls.post = Post.objects.create(text='Запись', author=cls.user,
+                                       group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+
+    def assertNotModified(self, url, etag, client=None):
+        client = client or self.client
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertIsNone(response.context)
+        return queries
+
+    def test_unchanged_feed_is_not_modified(self):
+        """Неизменная лента отдаёт 304 без запросов к базе"""
+        url = reverse('posts:blogs', kwargs={'slug': 'slug'})
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(len(self.assertNotModified(url, etag)), 0)
+        Post.objects.create(text='Новая', author=ConditionalGetTests.user,
+                            group=ConditionalGetTests.group)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_feed_etag_depends_on_viewer(self):
+        """ETag ленты у каждого посетителя свой"""
+        url = reverse('posts:index')
+        etag = self.client.get(url)['ETag']
+        reader = Client()
+        reader.force_login(ConditionalGetTests.reader)
+        response = reader.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Cookie', response['Vary'])
+
+    def test_unchanged_post_is_not_modified(self):
+        """Страница записи обновляется после комментария и правки"""
+        post = ConditionalGetTests.post
+        url = reverse('posts:post', kwargs={'username': 'testusername',
+                                            'post_id': post.id})
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(len(self.assertNotModified(url, etag)), 1)
+        Comment.objects.create(post=post, author=ConditionalGetTests.reader,
+                               text='Комментарий')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        post.text = 'Исправленная запись'
+        post.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Исправленная запись')
+
+    def test_missing_post_has_no_etag(self):
+        """Для несуществующей записи валидатора нет"""
+        response = self.client.get(
+            reverse('posts:post', kwargs={'username': 'testusername',
+                                          'post_id': 999}),
+            HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 404)
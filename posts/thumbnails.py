@@ -0,0 +1,154 @@
+"""
+Заранее подготовленные миниатюры картинок записей.
+
+Миниатюры всех размеров из POST_IMAGE_RENDITIONS создаются после
+сохранения записи фоновой задачей (posts.tasks), а не во время первого
+показа страницы. Пока миниатюра не готова, шаблон показывает заглушку.
+"""
+from django.conf import settings
+from django.db.models import F
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import \
+    KVStore as CachedDBKVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from .cache import bump_generations, post_scopes
+from .models import Post
+from .tasks import enqueue, task
+
+
+def _thumbnail_options(source, options):
+    # Те же умолчания, что подставляет ThumbnailBackend.get_thumbnail,
+    # иначе имя файла миниатюры не совпадёт
+    backend = default.backend
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def _rendition_file(image, rendition):
+    geometry, options = settings.POST_IMAGE_RENDITIONS[rendition]
+    source = ImageFile(image)
+    name = default.backend._get_thumbnail_filename(
+        source, geometry, _thumbnail_options(source, options))
+    return ImageFile(name, default.storage)
+
+
+def find_rendition(image, rendition):
+    """
+    Готовая миниатюра картинки или None.
+    В отличие от {% thumbnail %} никогда не создаёт её сама.
+    """
+    return default.kvstore.get(_rendition_file(image, rendition))
+
+
+def _get_many_raw(keys):
+    """Значения key-value хранилища sorl для многих ключей сразу."""
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedDBKVStore):
+        return {key: kvstore._get_raw(key) for key in keys}
+    values = kvstore.cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        found = dict(KVStoreModel.objects.filter(
+            key__in=missing).values_list('key', 'value'))
+        for key in missing:
+            # Как и сам KVStore, запоминаем и отсутствие значения
+            values[key] = found.get(key, EMPTY_VALUE)
+        kvstore.cache.set_many(
+            {key: values[key] for key in missing},
+            sorl_settings.THUMBNAIL_CACHE_TIMEOUT,
+        )
+    return {key: value for key, value in values.items()
+            if value is not None and value != EMPTY_VALUE}
+
+
+def prefetch_renditions(posts):
+    """
+    Находит все миниатюры для страницы записей одним обращением
+    к кэшу и не более чем одним запросом к БД. Результат сохраняется
+    в post.renditions, откуда его берут теги post_images.
+    """
+    targets = {}
+    for post in posts:
+        post.renditions = dict.fromkeys(settings.POST_IMAGE_RENDITIONS)
+        if post.image:
+            for rendition in settings.POST_IMAGE_RENDITIONS:
+                key = add_prefix(_rendition_file(post.image, rendition).key)
+                targets.setdefault(key, []).append((post, rendition))
+    if not targets:
+        return
+    for key, value in _get_many_raw(list(targets)).items():
+        image = deserialize_image_file(value)
+        for post, rendition in targets[key]:
+            post.renditions[rendition] = image
+
+
+def rendition_name(width, image_format):
+    return f'card-{width}-{image_format.lower()}'
+
+
+def default_rendition():
+    return rendition_name(settings.POST_IMAGE_DEFAULT_WIDTH,
+                          settings.POST_IMAGE_FORMATS[-1])
+
+
+@task
+def generate_renditions(post_id):
+    """Создаёт все миниатюры картинки записи и обновляет её карточку."""
+    post = Post.objects.select_related('author', 'group').filter(
+        pk=post_id).first()
+    if post is None or not post.image:
+        return
+    for geometry, options in settings.POST_IMAGE_RENDITIONS.values():
+        get_thumbnail(post.image, geometry, **options)
+    # Карточки и ленты с заглушкой устарели
+    Post.objects.filter(pk=post_id).update(version=F('version') + 1)
+    bump_generations(post_scopes(post))
+
+
+def schedule_renditions(post):
+    """Ставит создание миниатюр записи в очередь задач."""
+    if post.image:
+        enqueue(generate_renditions, post.pk, unique=True)
+
+
+def schedule_all_renditions(missing_only=False, batch_size=500):
+    """
+    Ставит в очередь миниатюры всех записей с картинками, с
+    ``missing_only`` — только тех, у которых готовы не все миниатюры.
+    Показ страниц миниатюры не заказывает, поэтому для записей, которые
+    появились без задачи, их заказывает эта функция (команда
+    generate_renditions). Возвращает число поставленных записей.
+    """
+    posts = Post.objects.exclude(image='').exclude(image__isnull=True)
+    scheduled = 0
+    batch = []
+
+    def schedule(batch):
+        if missing_only:
+            prefetch_renditions(batch)
+            batch = [post for post in batch
+                     if None in post.renditions.values()]
+        for post in batch:
+            schedule_renditions(post)
+        return len(batch)
+
+    for post in posts.only('id', 'image').iterator(chunk_size=batch_size):
+        batch.append(post)
+        if len(batch) >= batch_size:
+            scheduled += schedule(batch)
+            batch = []
+    return scheduled + schedule(batch)
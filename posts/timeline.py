@@ -0,0 +1,139 @@
+"""
+Материализованная лента подписок.
+
+После публикации запись раскладывается (fan-out on write) фоновой
+задачей по лентам подписчиков автора, поэтому follow_index читает один
+диапазон индекса ``(user, pub_date)`` вместо соединения через Follow.
+Записи авторов с очень большим числом подписчиков не раскладываются —
+они подмешиваются при чтении (гибридный режим). Когда такой автор
+теряет подписчиков и возвращается к раскладке, ленты подписчиков
+дополняются его последними записями (rejoin).
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+from .models import AuthorStats, Follow, Post, TimelineEntry
+from .tasks import task
+
+BATCH_SIZE = 500
+
+
+def is_fanned_out(author_id):
+    """Раскладываются ли записи автора по лентам подписчиков."""
+    return not AuthorStats.objects.filter(
+        user_id=author_id,
+        followers_count__gt=settings.TIMELINE_FANOUT_MAX_FOLLOWERS,
+    ).exists()
+
+
+def merged_author_ids(user):
+    """Авторы из подписок пользователя, читаемые в гибридном режиме."""
+    return list(
+        Follow.objects
+        .filter(
+            user=user,
+            author__stats__followers_count__gt=(
+                settings.TIMELINE_FANOUT_MAX_FOLLOWERS),
+        )
+        .values_list('author', flat=True)
+    )
+
+
+@task
+def fan_out(post_id):
+    """Добавляет новую запись в ленты подписчиков её автора."""
+    post = Post.objects.filter(pk=post_id).only(
+        'author_id', 'pub_date').first()
+    if post is None or not is_fanned_out(post.author_id):
+        return
+    follower_ids = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in follower_ids.iterator()),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    """Заполняет ленту последними записями автора после подписки."""
+    if not is_fanned_out(author_id):
+        return
+    posts = (Post.objects.filter(author_id=author_id)
+             .values_list('id', 'pub_date')[:settings.TIMELINE_BACKFILL])
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_follows(follows):
+    """
+    Дополняет ленты по всем подпискам из набора follows. Строки ленты
+    копятся пачками и пишутся в одной транзакции, а не по одной
+    подписке за раз.
+    """
+    merged = set(
+        AuthorStats.objects
+        .filter(followers_count__gt=settings.TIMELINE_FANOUT_MAX_FOLLOWERS)
+        .values_list('user_id', flat=True)
+    )
+    recent = {}
+    batch = []
+    with transaction.atomic():
+        pairs = follows.values_list('user_id', 'author_id')
+        for user_id, author_id in pairs.iterator():
+            if author_id in merged:
+                continue
+            if author_id not in recent:
+                recent[author_id] = list(
+                    Post.objects.filter(author_id=author_id)
+                    .values_list('id', 'pub_date')
+                    [:settings.TIMELINE_BACKFILL]
+                )
+            batch.extend(
+                TimelineEntry(user_id=user_id, post_id=post_id,
+                              pub_date=pub_date)
+                for post_id, pub_date in recent[author_id]
+            )
+            if len(batch) >= BATCH_SIZE:
+                TimelineEntry.objects.bulk_create(batch,
+                                                  ignore_conflicts=True)
+                batch = []
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+@task
+def rejoin(author_id):
+    """
+    Дополняет ленты подписчиков автора, вернувшегося к раскладке: пока
+    он подмешивался при чтении, его записи в ленты не попадали.
+    """
+    if is_fanned_out(author_id):
+        backfill_follows(Follow.objects.filter(author_id=author_id))
+
+
+def trim(user_id, author_id):
+    """Убирает из ленты записи автора после отписки."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+def timeline_posts(user):
+    """Записи ленты подписок пользователя."""
+    merged = merged_author_ids(user)
+    if not merged:
+        # Порядок по полям самой ленты: тогда SQL идёт по индексу
+        # (user, pub_date, post) и не сортирует соединение с записями
+        return (
+            Post.objects.filter(timeline_entries__user=user)
+            .annotate(feed_date=F('timeline_entries__pub_date'),
+                      feed_post=F('timeline_entries__post'))
+            .order_by('-feed_date', '-feed_post')
+        )
+    entries = TimelineEntry.objects.filter(user=user).values('post')
+    return Post.objects.filter(Q(pk__in=entries) | Q(author__in=merged))
@@ -0,0 +1,356 @@
+"""
+Массовая выгрузка и загрузка сообществ, записей, комментариев и подписок.
+
+Формат — JSONL (по объекту на строку, модель в поле ``model``) или CSV
+(одна модель на файл). Пользователи и сообщества указываются именем
+и slug, поэтому файл можно перенести в другую базу. Записи и
+комментарии указываются id из файла: при загрузке id сохраняется, если
+он свободен, а если занят другой строкой, выдаётся новый, и комментарии
+файла ссылаются на записи по этому соответствию (_assign_ids).
+Комментарии к записям, которых нет в файле, ссылаются на id базы.
+
+Загрузка идёт пачками через bulk_create, каждая пачка — отдельная
+транзакция. Сигналы при этом не срабатывают, поэтому после загрузки
+счётчики пересчитываются, ленты подписок дополняются, новые записи
+попадают в поисковый индекс, для их картинок ставятся в очередь
+миниатюры, а закэшированные ленты устаревают.
+"""
+import csv
+import json
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import search, thumbnails, timeline
+from .cache import (INDEX_SCOPE, author_scope, bump_generations,
+                    group_scope)
+from .counters import recount_all
+from .models import Comment, Follow, Group, Post, User
+from .tasks import enqueue
+
+# В порядке зависимостей: так их и нужно загружать
+FIELDS = {
+    'group': ['slug', 'title', 'description'],
+    'post': ['id', 'author', 'group', 'text', 'pub_date', 'image'],
+    'comment': ['id', 'post', 'author', 'text', 'created'],
+    'follow': ['user', 'author'],
+}
+MODELS = {'group': Group, 'post': Post, 'comment': Comment,
+          'follow': Follow}
+EXPORT_QUERYSETS = {
+    'group': lambda: Group.objects.values_list(
+        'slug', 'title', 'description'),
+    'post': lambda: Post.objects.values_list(
+        'id', 'author__username', 'group__slug', 'text', 'pub_date',
+        'image'),
+    'comment': lambda: Comment.objects.values_list(
+        'id', 'post_id', 'author__username', 'text', 'created'),
+    'follow': lambda: Follow.objects.values_list(
+        'user__username', 'author__username'),
+}
+# Модели с естественным ключом (slug, пара подписки): совпадающие строки
+# пропускаются при вставке. Записям и комментариям id выдаёт _assign_ids
+SKIP_EXISTING = {'group', 'follow'}
+BATCH_SIZE = 500
+
+
+def export_records(model_name):
+    """Записи модели как словари; в памяти одна порция iterator()."""
+    fields = FIELDS[model_name]
+    queryset = EXPORT_QUERYSETS[model_name]().order_by('pk')
+    for row in queryset.iterator(chunk_size=BATCH_SIZE):
+        yield dict(zip(fields, row))
+
+
+def _plain(record):
+    # Даты — в ISO 8601 с микросекундами, чтобы порядок лент сохранился
+    return {key: value.isoformat() if hasattr(value, 'isoformat') else value
+            for key, value in record.items()}
+
+
+def write_jsonl(stream, model_names):
+    for model_name in model_names:
+        for record in export_records(model_name):
+            stream.write(json.dumps({'model': model_name, **_plain(record)},
+                                    ensure_ascii=False))
+            stream.write('\n')
+
+
+def write_csv(stream, model_name):
+    writer = csv.DictWriter(stream, FIELDS[model_name])
+    writer.writeheader()
+    for record in export_records(model_name):
+        writer.writerow(_plain(record))
+
+
+def read_jsonl(stream):
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            raise ValueError(f'строка {number}: {error}')
+        yield record.pop('model', None), record
+
+
+def read_csv(stream, model_name):
+    for record in csv.DictReader(stream):
+        # В CSV нет null: пустая строка означает отсутствие значения
+        yield model_name, {key: value if value != '' else None
+                           for key, value in record.items()}
+
+
+def _chunks(ids, size=500):
+    # Списки id для IN (...) не длиннее лимита параметров SQLite
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+@contextmanager
+def explicit_dates():
+    """
+    bulk_create подставляет текущее время в поля auto_now_add.
+    На время загрузки отключаем это, чтобы сохранить даты из файла.
+    """
+    fields = [Post._meta.get_field('pub_date'),
+              Comment._meta.get_field('created')]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def _parse_id(value):
+    return int(value) if value not in (None, '') else None
+
+
+def _assign_ids(model, objects, key):
+    """
+    Выдаёт id объектам пачки из файла. id из файла сохраняется, если он
+    свободен. Объект, уже загруженный раньше (совпадают поля key — под
+    тем же или под новым id), пропускается; если id занят другим
+    объектом, объект получает новый id. Возвращает объекты для вставки и
+    соответствие id файла -> id базы.
+    """
+    def natural_key(obj):
+        return tuple(getattr(obj, field) for field in key)
+
+    wanted = [obj.pk for obj in objects if obj.pk is not None]
+    existing = {
+        row[0]: row[1:] for row in
+        model.objects.filter(pk__in=wanted).values_list('pk', *key)
+    }
+    taken = [obj for obj in objects if obj.pk in existing
+             and existing[obj.pk] != natural_key(obj)]
+    # Ранее загруженные под новым id ищутся по самому ключу
+    loaded = {}
+    if taken:
+        lookup = {f'{field}__in': {getattr(obj, field) for obj in taken}
+                  for field in key}
+        loaded = {row[1:]: row[0] for row in
+                  model.objects.filter(**lookup).values_list('pk', *key)}
+    next_id = max([model.objects.aggregate(last=Max('pk'))['last'] or 0,
+                   *wanted]) + 1
+    fresh = []
+    ids = {}
+    for obj in objects:
+        old = obj.pk
+        if old in existing:
+            if existing[old] == natural_key(obj):
+                ids[old] = old
+                continue
+            if natural_key(obj) in loaded:
+                ids[old] = loaded[natural_key(obj)]
+                continue
+            obj.pk = None
+        if obj.pk is None:
+            obj.pk = next_id
+            next_id += 1
+        if old is not None:
+            ids[old] = obj.pk
+        fresh.append(obj)
+    return fresh, ids
+
+
+def _parse_date(value):
+    if not value:
+        return timezone.now()
+    date = parse_datetime(value) if isinstance(value, str) else value
+    if date is None:
+        raise ValueError(f'неверная дата {value!r}')
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+class Importer:
+    """Загружает поток записей пачками; итог подводит finish()."""
+
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self.batch = []
+        self.batch_model = None
+        # Кэш поиска: имя -> id пользователя, slug -> id сообщества
+        self.users = {}
+        self.groups = {}
+        # id записей из файла -> id в базе
+        self.post_ids = {}
+        self.counts = dict.fromkeys(FIELDS, 0)
+        self.scopes = {INDEX_SCOPE}
+        # Авторы загруженных записей и пользователи новых подписок:
+        # их ленты нужно дополнить
+        self.authors = set()
+        self.followers = set()
+        # Записи с картинками: им нужны миниатюры
+        self.images = set()
+
+    def add(self, model_name, record):
+        if model_name not in FIELDS:
+            raise ValueError(f'неизвестная модель {model_name!r}')
+        if model_name != self.batch_model or (
+                len(self.batch) >= self.batch_size):
+            self.flush()
+            self.batch_model = model_name
+        self.batch.append(record)
+
+    def flush(self):
+        if not self.batch:
+            return
+        build = getattr(self, f'build_{self.batch_model}')
+        with transaction.atomic(), explicit_dates():
+            objects = build(self.batch)
+            MODELS[self.batch_model].objects.bulk_create(
+                objects,
+                ignore_conflicts=self.batch_model in SKIP_EXISTING)
+        self.counts[self.batch_model] += len(self.batch)
+        self.batch = []
+
+    def finish(self):
+        """Дописывает остаток и восстанавливает производные данные."""
+        self.flush()
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                    no_style(), list(MODELS.values())):
+                cursor.execute(sql)
+        with transaction.atomic():
+            recount_all()
+        # Ленты дополняются после пересчёта: от числа подписчиков
+        # зависит, раскладываются ли записи автора
+        for ids in _chunks(self.authors):
+            timeline.backfill_follows(Follow.objects.filter(author__in=ids))
+        for ids in _chunks(self.followers):
+            timeline.backfill_follows(Follow.objects.filter(user__in=ids))
+        search.index_missing()
+        for post_id in sorted(self.images):
+            enqueue(thumbnails.generate_renditions, post_id, unique=True)
+        bump_generations(self.scopes)
+        return self.counts
+
+    def resolve_users(self, usernames):
+        missing = {name for name in usernames if name not in self.users}
+        if missing:
+            found = dict(User.objects.filter(
+                username__in=missing).values_list('username', 'pk'))
+            new = missing - found.keys()
+            if new:
+                # Авторы из файла, которых нет в базе, заводятся без пароля
+                User.objects.bulk_create(
+                    User(username=name, password=make_password(None))
+                    for name in new
+                )
+                found.update(User.objects.filter(
+                    username__in=new).values_list('username', 'pk'))
+            self.users.update(found)
+        return self.users
+
+    def resolve_groups(self, slugs):
+        missing = {slug for slug in slugs
+                   if slug and slug not in self.groups}
+        if missing:
+            self.groups.update(Group.objects.filter(
+                slug__in=missing).values_list('slug', 'pk'))
+            unknown = missing - self.groups.keys()
+            if unknown:
+                raise ValueError(
+                    f'неизвестные сообщества: {", ".join(sorted(unknown))}')
+        return self.groups
+
+    def build_group(self, records):
+        return [Group(slug=record['slug'], title=record['title'],
+                      description=record.get('description') or '')
+                for record in records]
+
+    def build_post(self, records):
+        users = self.resolve_users(record['author'] for record in records)
+        groups = self.resolve_groups(record.get('group')
+                                     for record in records)
+        posts = []
+        for record in records:
+            group = record.get('group')
+            posts.append(Post(
+                id=_parse_id(record.get('id')),
+                author_id=users[record['author']],
+                group_id=groups[group] if group else None,
+                text=record['text'],
+                pub_date=_parse_date(record.get('pub_date')),
+                image=record.get('image') or '',
+            ))
+            self.authors.add(users[record['author']])
+            self.scopes.add(author_scope(record['author']))
+            if group:
+                self.scopes.add(group_scope(group))
+        posts, ids = _assign_ids(Post, posts, ('author_id', 'pub_date'))
+        self.post_ids.update(ids)
+        self.images.update(post.pk for post in posts if post.image)
+        return posts
+
+    def resolve_posts(self, post_ids):
+        """id записей в базе по id из файла."""
+        post_ids = {_parse_id(post_id) for post_id in post_ids}
+        missing = post_ids - self.post_ids.keys()
+        if missing:
+            # Записи не из этого файла ищутся по id в базе
+            found = set(Post.objects.filter(
+                pk__in=missing).values_list('pk', flat=True))
+            unknown = missing - found
+            if unknown:
+                unknown = ', '.join(map(str, sorted(unknown)))
+                raise ValueError(f'неизвестные записи: {unknown}')
+            self.post_ids.update((pk, pk) for pk in found)
+        return self.post_ids
+
+    def build_comment(self, records):
+        users = self.resolve_users(record['author'] for record in records)
+        posts = self.resolve_posts(record['post'] for record in records)
+        comments = [Comment(id=_parse_id(record.get('id')),
+                            post_id=posts[_parse_id(record['post'])],
+                            author_id=users[record['author']],
+                            text=record['text'],
+                            created=_parse_date(record.get('created')))
+                    for record in records]
+        comments, _ = _assign_ids(Comment, comments,
+                                  ('post_id', 'author_id', 'created'))
+        return comments
+
+    def build_follow(self, records):
+        users = self.resolve_users(
+            name for record in records
+            for name in (record['user'], record['author']))
+        for record in records:
+            self.followers.add(users[record['user']])
+            self.scopes.add(author_scope(record['user']))
+            self.scopes.add(author_scope(record['author']))
+        return [Follow(user_id=users[record['user']],
+                       author_id=users[record['author']])
+                for record in records
+                if record['user'] != record['author']]
@@ -11,6 +11,7 @@ urlpatterns = [
     path("follow/", views.follow_index, name="follow_index"),
     path('group/<slug:slug>/', views.group_posts, name='blogs'),
     path('new/', views.new_post, name='new_post'),
+    path('search/', views.search, name='search'),
     # Профайл пользователя
     path('<str:username>/', views.profile, name='profile'),
     # Просмотр записи
@@ -22,6 +23,8 @@ urlpatterns = [
     ),
     path('<str:username>/<int:post_id>/comment', views.add_comment,
          name='add_comment'),
+    path('<str:username>/<int:post_id>/comments/', views.post_comments,
+         name='post_comments'),
     path("<str:username>/follow/", views.profile_follow, name="profile_follow"),
     path("<str:username>/unfollow/", views.profile_unfollow,
          name="profile_unfollow"),
@@ -1,21 +1,37 @@
+from urllib.parse import urlencode
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import JsonResponse
 from django.shortcuts import (get_list_or_404, get_object_or_404, redirect,
                               render)
 from django.urls import reverse
-from django.views.decorators.cache import cache_page
-from yatube.settings import RECORDS_ON_THE_PAGE
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_cookie
+from yatube.routers import pins_primary
+from yatube.settings import COMMENTS_ON_THE_PAGE, RECORDS_ON_THE_PAGE
 
+from .cache import (INDEX_SCOPE, author_scope, cache_feed, get_generations,
+                    group_scope, page_etag, timeline_scope)
+from .counting import estimate_posts, feed_count
+from .counters import get_stats
 from .forms import CommentForm, PostForm
 from .models import Follow, Group, Post, User
+from .paginator import CursorPaginator, add_page_window, paginate
+from .search import search_posts
+from .thumbnails import prefetch_renditions, schedule_renditions
+from .timeline import timeline_posts
 
 
-@cache_page(20)
+@cache_feed(lambda: [INDEX_SCOPE])
 def index(request):
-    posts = Post.objects.all()
-    paginator = Paginator(posts, RECORDS_ON_THE_PAGE)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    posts = Post.objects.for_feed()
+    paginator, page = paginate(
+        request, posts,
+        count=lambda: feed_count(posts, INDEX_SCOPE, estimate_posts))
+    prefetch_renditions(page)
     context = {
         "paginator": paginator,
         "page": page
@@ -23,13 +39,14 @@ def index(request):
     return render(request, "index.html", context)
 
 
+@cache_feed(lambda slug: [group_scope(slug)])
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
 
-    posts = group.posts.all()
-    paginator = Paginator(posts, RECORDS_ON_THE_PAGE)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    posts = group.posts.for_feed()
+    paginator, page = paginate(
+        request, posts, count=lambda: feed_count(posts, group_scope(slug)))
+    prefetch_renditions(page)
     context = {
         "paginator": paginator,
         "group": group,
@@ -39,50 +56,124 @@ def group_posts(request, slug):
 
 
 @login_required
+@transaction.atomic
 def new_post(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        schedule_renditions(post)
         return redirect(reverse("posts:index"))
 
     return render(request, "new_post.html", {"form": form})
 
 
+@cache_feed(lambda username: [author_scope(username)])
 def profile(request, username):
     user = get_object_or_404(User, username=username)
-    posts = user.posts.all()
-    user_post_count = user.posts.all().count()
-    paginator = Paginator(posts, RECORDS_ON_THE_PAGE)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    posts = user.posts.for_feed()
+    author_stats = get_stats(user)
+    # Счётчик автора точный и уже загружен
+    paginator, page = paginate(request, posts,
+                               count=lambda: author_stats.posts_count)
+    prefetch_renditions(page)
     context = {
         "paginator": paginator,
         "profile_user": user,
-        "user_post_count": user_post_count,
+        "author_stats": author_stats,
+        "user_post_count": author_stats.posts_count,
         "page": page,
     }
     return render(request, "profile.html", context)
 
 
+def search(request):
+    query = request.GET.get("q", "").strip()
+    posts = search_posts(query).for_feed()
+    # Результаты упорядочены по релевантности, поэтому страницы
+    # нумерованные, без курсоров по дате
+    paginator = Paginator(posts, RECORDS_ON_THE_PAGE)
+    page = add_page_window(paginator.get_page(request.GET.get("page")))
+    prefetch_renditions(page)
+    context = {
+        "paginator": paginator,
+        "page": page,
+        "query": query,
+        "page_query": urlencode({"q": query}) + "&",
+    }
+    return render(request, "search.html", context)
+
+
+def comments_paginator(post):
+    comments = post.comments.select_related("author")
+    return CursorPaginator(comments, COMMENTS_ON_THE_PAGE,
+                           ordering=("created", "id"))
+
+
+def post_etag(request, username, post_id):
+    """
+    Версия записи и число комментариев поддерживаются при изменениях,
+    поколение автора меняется вместе с его счётчиками — проверка стоит
+    одного запроса по первичному ключу. Токен CSRF формы комментария
+    зависит от cookie.
+    """
+    try:
+        post = Post.objects.values_list("version", "comment_count").get(
+            id=post_id, author__username=username)
+    except Post.DoesNotExist:
+        return None
+    return page_etag(request, post, get_generations([author_scope(username)]),
+                     request.COOKIES.get(settings.CSRF_COOKIE_NAME))
+
+
+@vary_on_cookie
+@condition(etag_func=post_etag)
 def post_view(request, username, post_id):
     post = get_object_or_404(Post, id=post_id,
                              author__username=username)
     user = post.author
-    comments = post.comments.all()
-    user_post_count = Post.objects.filter(author=user).count()
+    prefetch_renditions([post])
+    paginator = comments_paginator(post)
+    author_stats = get_stats(user)
     form = CommentForm(request.POST or None)
     context = {
         "profile_user": user,
-        "user_post_count": user_post_count,
+        "author_stats": author_stats,
+        "user_post_count": author_stats.posts_count,
         "post": post,
         "form": form,
-        "comments": comments
+        # Весь список остаётся ленивым QuerySet, выводится только
+        # первая страница, остальные подгружаются через post_comments
+        "comments": paginator.object_list,
+        "comments_page": paginator.get_page(),
     }
 
     return render(request, "post.html", context)
 
+
+def post_comments(request, username, post_id):
+    """Следующие страницы комментариев для подгрузки на странице записи."""
+    post = get_object_or_404(Post, id=post_id,
+                             author__username=username)
+    comments = comments_paginator(post).get_page(
+        after=request.GET.get("after"))
+    if request.GET.get("format") == "json":
+        return JsonResponse({
+            "comments": [
+                {
+                    "id": comment.id,
+                    "author": comment.author.username,
+                    "text": comment.text,
+                    "created": comment.created.isoformat(),
+                }
+                for comment in comments
+            ],
+            "next": comments.next_cursor,
+        })
+    return render(request, "includes/comment_list.html",
+                  {"post": post, "comments": comments})
+
 @login_required
 def post_edit(request, username, post_id):
     current_user = request.user
@@ -96,7 +187,11 @@ def post_edit(request, username, post_id):
                     files=request.FILES or None,
                     instance=post)
     if form.is_valid():
-        form.save()
+        # Счётчик комментариев обновляется отдельно, не затираем его
+        post = form.save(commit=False)
+        post.save(update_fields=[*form.Meta.fields, "version"])
+        if "image" in form.changed_data:
+            schedule_renditions(post)
         return redirect(reverse("posts:post", kwargs={"username": username,
                                                       "post_id": post_id}))
 
@@ -106,6 +201,7 @@ def post_edit(request, username, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, username, post_id):
     form = CommentForm(request.POST or None)
     post = Post.objects.get(id__exact=post_id)
@@ -137,10 +233,11 @@ def server_error(request):
 @login_required
 def follow_index(request):
     user = request.user
-    posts = Post.objects.filter(author__following__user=user)
-    paginator = Paginator(posts, RECORDS_ON_THE_PAGE)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    posts = timeline_posts(user).for_feed()
+    paginator, page = paginate(
+        request, posts,
+        count=lambda: feed_count(posts, timeline_scope(user.pk)))
+    prefetch_renditions(page)
     context = {
         "paginator": paginator,
         "page": page,
@@ -150,6 +247,8 @@ def follow_index(request):
 
 
 @login_required
+@pins_primary
+@transaction.atomic
 def profile_follow(request, username):
     user = request.user
     author = get_object_or_404(User, username=username)
@@ -162,6 +261,8 @@ def profile_follow(request, username):
 
 
 @login_required
+@pins_primary
+@transaction.atomic
 def profile_unfollow(request, username):
     follow = get_object_or_404(Follow, author__username=username, user=request.user)
     follow.delete()
@@ -0,0 +1,154 @@
+"""
+Прогрев кэша лент после выкладки или перезапуска воркеров.
+
+Пустой кэш означает, что первая волна посетителей одновременно
+собирает главную, популярные сообщества и профили из базы. ``warm``
+заранее запрашивает первые CACHE_WARMUP_PAGES страниц этих лент от
+анонимного посетителя (его страницы видит большинство) — cache_feed
+сохраняет их так же, как при обычном запросе. Страницы после первой
+берутся по тем же курсорным адресам (``?after=``), что и ссылки
+«Следующая» в ленте (posts.paginator.paginate): по ним посетители
+и листают ленты. Запросы строятся
+RequestFactory с настоящим именем сайта (CACHE_WARMUP_HOST) и идут через
+весь стек посредников BaseHandler, поэтому в кэш попадает ровно то, что
+получил бы посетитель. Тестовый Client здесь не годится: он
+переподключает глобальные обработчики сигналов запроса, а это гонка с
+настоящими запросами воркера.
+
+Работа выполняется пулом не больше чем из CACHE_WARMUP_WORKERS потоков:
+прогрев не должен сам занять все соединения с базой. Потоки, а не
+процессы, потому что кэш в памяти (LocMemCache в режиме разработки)
+виден только внутри процесса.
+
+Команда warm_cache прогревает кэш по требованию; при
+CACHE_WARMUP_ON_START то же делает yatube.wsgi в фоновом потоке при
+запуске воркера.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.base import BaseHandler
+from django.db import connections
+from django.db.models import Count
+from django.test import RequestFactory
+from django.urls import reverse
+from yatube.settings import RECORDS_ON_THE_PAGE
+
+from .models import AuthorStats, Group, Post
+from .paginator import CursorPaginator
+
+logger = logging.getLogger(__name__)
+
+# Адрес не из INTERNAL_IPS: панель отладки не должна попасть в кэш
+WARMUP_ADDR = '192.0.2.2'
+
+
+def _pages(url, posts, pages):
+    """
+    Адреса первых страниц ленты posts: первая и следующие за ней по
+    ссылкам «Следующая». Курсор ссылки — ключ сортировки последней
+    записи страницы, поэтому достаточно прочитать ключи первых записей.
+    """
+    cursors = CursorPaginator(posts, RECORDS_ON_THE_PAGE)
+    ordering = [f'-{name}' for name in cursors.ordering]
+    # Лишняя запись показывает, есть ли у последней страницы следующая
+    limit = RECORDS_ON_THE_PAGE * max(pages - 1, 0) + 1
+    keys = list(posts.order_by(*ordering).only(*cursors.attnames)[:limit])
+    return [url] + [
+        f'{url}?after={cursors.cursor_for(keys[last])}'
+        for last in range(RECORDS_ON_THE_PAGE - 1, len(keys) - 1,
+                          RECORDS_ON_THE_PAGE)
+    ]
+
+
+def hot_urls(pages=None, groups=None, profiles=None):
+    """
+    Адреса для прогрева: главная, сообщества с наибольшим числом
+    записей и авторы с наибольшим числом подписчиков.
+    """
+    pages = settings.CACHE_WARMUP_PAGES if pages is None else pages
+    groups = settings.CACHE_WARMUP_GROUPS if groups is None else groups
+    if profiles is None:
+        profiles = settings.CACHE_WARMUP_PROFILES
+    urls = _pages(reverse('posts:index'), Post.objects.all(), pages)
+    top_groups = (Group.objects.annotate(posts_count=Count('posts'))
+                  .order_by('-posts_count', 'pk')
+                  .values_list('pk', 'slug')[:groups])
+    for group_id, slug in top_groups:
+        urls += _pages(reverse('posts:blogs', kwargs={'slug': slug}),
+                       Post.objects.filter(group_id=group_id), pages)
+    top_authors = (AuthorStats.objects.order_by('-followers_count', 'pk')
+                   .values_list('user_id', 'user__username')[:profiles])
+    for user_id, username in top_authors:
+        urls += _pages(reverse('posts:profile',
+                               kwargs={'username': username}),
+                       Post.objects.filter(author_id=user_id), pages)
+    return urls
+
+
+def warmup_host():
+    """Имя сайта для запросов прогрева: первое явное из ALLOWED_HOSTS."""
+    if settings.CACHE_WARMUP_HOST:
+        return settings.CACHE_WARMUP_HOST
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*':
+            return host.lstrip('.')
+    return 'localhost'
+
+
+def _fetch(handler, factory, url):
+    started = time.perf_counter()
+    try:
+        status = handler.get_response(factory.get(url)).status_code
+    except Exception:
+        # Одна сломанная страница не должна останавливать прогрев
+        logger.exception('Страница %s не прогрета', url)
+        status = None
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            # Соединения потока пула больше не понадобятся
+            connections.close_all()
+    return url, status, time.perf_counter() - started
+
+
+def warm(urls, workers=None):
+    """
+    Запрашивает адреса не больше чем в workers потоках; возвращает
+    тройки (адрес, статус, секунды) в порядке адресов. Статус None —
+    страница упала с исключением.
+    """
+    workers = settings.CACHE_WARMUP_WORKERS if workers is None else workers
+    handler = BaseHandler()
+    handler.load_middleware()
+    factory = RequestFactory(HTTP_HOST=warmup_host(),
+                             REMOTE_ADDR=WARMUP_ADDR)
+
+    def fetch(url):
+        return _fetch(handler, factory, url)
+
+    if workers <= 1:
+        return [fetch(url) for url in urls]
+    with ThreadPoolExecutor(max_workers=workers,
+                            thread_name_prefix='warmup') as pool:
+        return list(pool.map(fetch, urls))
+
+
+def warm_in_background():
+    """Прогревает кэш, не задерживая запуск воркера."""
+    def run():
+        try:
+            started = time.perf_counter()
+            results = warm(hot_urls())
+            logger.info('Кэш прогрет: %s страниц за %.1f с', len(results),
+                        time.perf_counter() - started)
+        except Exception:
+            logger.exception('Кэш не прогрет')
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=run, name='warmup', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,33 @@
+"""
+Настройка соединений с SQLite.
+
+По умолчанию SQLite пишет через журнал отката: запись блокирует всю базу,
+и читатели ждут её окончания. В режиме WAL чтения идут параллельно
+с записью, а synchronous=NORMAL сбрасывает данные на диск только при
+контрольной точке, а не при каждом коммите. Остальные PRAGMA из
+SQLITE_PRAGMAS увеличивают кэш страниц и отображают файл в память.
+
+Параметры соединения (PRAGMA) не сохраняются в файле базы, кроме
+journal_mode, поэтому применяются к каждому новому соединению.
+"""
+from django.conf import settings
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """Обработчик connection_created: применяет SQLITE_PRAGMAS."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def get_pragmas(connection, names=None):
+    """Действующие значения PRAGMA соединения — для проверки настройки."""
+    names = names or settings.SQLITE_PRAGMAS
+    values = {}
+    with connection.cursor() as cursor:
+        for name in names:
+            cursor.execute(f'PRAGMA {name}')
+            values[name] = cursor.fetchone()[0]
+    return values
@@ -0,0 +1,367 @@
+"""
+Метрики производительности запросов в формате Prometheus.
+
+MetricsMiddleware замеряет долю METRICS_SAMPLE_RATE запросов: общее
+время ответа, время и число запросов к базе, время отрисовки шаблона и
+попадания в кэш. Замеры складываются в гистограммы по имени
+представления в памяти процесса и отдаются по адресу ``/metrics``
+(доступ — allowed_to_scrape). У каждого воркера свои гистограммы —
+Prometheus собирает их с каждого воркера отдельно.
+
+Незамеряемый запрос проходит мимо: база и шаблоны не оборачиваются,
+кэш только проверяет, что замера нет. Для учёта шаблонов и кэша в
+настройках указываются InstrumentedDjangoTemplates и кэши отсюда.
+
+Чтобы оценить полное число запросов, счётчики делятся на
+``yatube_metrics_sample_rate``.
+
+Запросы к базе замеряемых ответов проверяются на N+1 и медленные
+запросы (yatube.querylog). После замера отправляется сигнал
+request_measured с именем представления и замерами. Перед выдачей
+/metrics отправляется сигнал collect_metrics: его получатели записывают
+текущие значения показателей (gauge) через ``registry.set``.
+"""
+import hmac
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections
+from django.dispatch import Signal
+from django.http import Http404, HttpResponse
+from django.template.backends.django import DjangoTemplates
+
+from .querylog import QueryLog, check_queries
+from .sqlite_cache import SQLiteCache
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# Имя -> (тип, описание, границы корзин гистограммы)
+METRICS = {
+    'yatube_request_duration_seconds': (
+        'histogram', 'Время ответа', TIME_BUCKETS),
+    'yatube_db_duration_seconds': (
+        'histogram', 'Время запросов к базе за один ответ', TIME_BUCKETS),
+    'yatube_db_queries': (
+        'histogram', 'Число запросов к базе за один ответ', QUERY_BUCKETS),
+    'yatube_template_duration_seconds': (
+        'histogram', 'Время отрисовки шаблона ответа', TIME_BUCKETS),
+    'yatube_cache_requests_total': (
+        'counter', 'Чтения из кэша по результату', None),
+    'yatube_responses_total': (
+        'counter', 'Замеренные ответы по статусу', None),
+    'yatube_repeated_queries_total': (
+        'counter', 'Формы запросов, повторённые за ответ (N+1)', None),
+    'yatube_slow_queries_total': (
+        'counter', 'Запросы дольше SLOW_QUERY_SECONDS', None),
+    'yatube_feed_cache_total': (
+        'counter', 'Страницы лент: свежие, прежние копии, пересборки и '
+                   'дождавшиеся чужой пересборки', None),
+    'yatube_tasks': (
+        'gauge', 'Задачи фоновой очереди по состоянию', None),
+    'yatube_task_lag_seconds': (
+        'gauge', 'Ожидание самой старой готовой задачи', None),
+}
+
+_state = threading.local()
+
+request_measured = Signal(providing_args=['view', 'stats'])
+collect_metrics = Signal()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # Последняя корзина — для значений больше всех границ
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        """Пары (граница, накопленное число) как в Prometheus."""
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+class Registry:
+    """Метрики процесса; ключ — имя и набор меток."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = self._values[key] = Histogram(METRICS[name][2])
+            histogram.observe(value)
+
+    def inc(self, name, labels, amount=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def export(self):
+        """Текстовый формат Prometheus."""
+        with self._lock:
+            values = sorted(self._values.items(), key=lambda item: item[0])
+            values = [(key, _snapshot(value)) for key, value in values]
+        lines = [
+            '# HELP yatube_metrics_sample_rate Доля замеряемых запросов',
+            '# TYPE yatube_metrics_sample_rate gauge',
+            f'yatube_metrics_sample_rate {settings.METRICS_SAMPLE_RATE}',
+        ]
+        for name, (kind, description, _) in METRICS.items():
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            for (metric, labels), value in values:
+                if metric != name:
+                    continue
+                if kind != 'histogram':
+                    lines.append(f'{name}{_labels(labels)} {value}')
+                    continue
+                for bound, count in value['buckets']:
+                    lines.append(f'{name}_bucket'
+                                 f'{_labels(labels + (("le", bound),))} '
+                                 f'{count}')
+                lines.append(f'{name}_sum{_labels(labels)} {value["sum"]}')
+                lines.append(
+                    f'{name}_count{_labels(labels)} {value["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _snapshot(value):
+    if not isinstance(value, Histogram):
+        return value
+    return {'buckets': list(value.samples()), 'sum': value.sum,
+            'count': value.count}
+
+
+def _labels(labels):
+    def escape(value):
+        return (str(value).replace('\\', r'\\').replace('"', r'\"')
+                .replace('\n', r'\n'))
+    return '{' + ','.join(f'{name}="{escape(value)}"'
+                          for name, value in labels) + '}'
+
+
+registry = Registry()
+
+
+class RequestStats:
+    """Замеры одного запроса."""
+
+    def __init__(self):
+        self.db_time = 0
+        self.queries = 0
+        self.template_time = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.query_log = QueryLog()
+        # Вложенные отрисовки и get_many, вызывающий get, не считаются
+        # повторно
+        self.rendering = False
+        self.reading_many = False
+
+
+def current_stats():
+    """Замеры текущего запроса или None, если он не замеряется."""
+    return getattr(_state, 'stats', None)
+
+
+@contextmanager
+def unmeasured():
+    """
+    Работа внутри блока не относится к текущему ответу: так выполняются
+    фоновые задачи, запущенные сразу, когда пула воркеров нет.
+    """
+    stats = current_stats()
+    _state.stats = None
+    try:
+        yield
+    finally:
+        _state.stats = stats
+
+
+def time_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats = current_stats()
+        if stats is not None:
+            duration = time.perf_counter() - started
+            stats.db_time += duration
+            stats.queries += 1
+            stats.query_log.add(sql, duration)
+
+
+class MetricsMiddleware:
+    """Замеряет часть запросов и складывает замеры в registry."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+        stats = _state.stats = RequestStats()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(time_query))
+                response = self.get_response(request)
+        finally:
+            _state.stats = None
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        if view != 'metrics':
+            record(view, response.status_code, stats,
+                   time.perf_counter() - started)
+            request_measured.send(sender=self.__class__, view=view,
+                                  stats=stats)
+        return response
+
+
+def record(view, status, stats, duration):
+    labels = {'view': view}
+    registry.observe('yatube_request_duration_seconds', labels, duration)
+    registry.observe('yatube_db_duration_seconds', labels, stats.db_time)
+    registry.observe('yatube_db_queries', labels, stats.queries)
+    registry.observe('yatube_template_duration_seconds', labels,
+                     stats.template_time)
+    registry.inc('yatube_cache_requests_total',
+                 {**labels, 'result': 'hit'}, stats.cache_hits)
+    registry.inc('yatube_cache_requests_total',
+                 {**labels, 'result': 'miss'}, stats.cache_misses)
+    registry.inc('yatube_responses_total',
+                 {**labels, 'status': status})
+    repeated, slow = check_queries(view, stats.query_log)
+    registry.inc('yatube_repeated_queries_total', labels, len(repeated))
+    registry.inc('yatube_slow_queries_total', labels, len(slow))
+
+
+# Заголовки, которые ставит обратный прокси: запрос пришёл извне, даже
+# если REMOTE_ADDR — адрес самого прокси
+PROXY_HEADERS = ('HTTP_X_FORWARDED_FOR', 'HTTP_X_REAL_IP', 'HTTP_FORWARDED')
+
+
+def allowed_to_scrape(request):
+    """
+    С METRICS_TOKEN нужен заголовок ``Authorization: Bearer <токен>``.
+    Без токена метрики отдаются только прямым запросам с адресов
+    METRICS_ALLOWED_IPS: за прокси все запросы приходят с его адреса,
+    поэтому пересланные прокси запросы отклоняются.
+    """
+    if settings.METRICS_TOKEN:
+        return hmac.compare_digest(
+            request.META.get('HTTP_AUTHORIZATION', ''),
+            f'Bearer {settings.METRICS_TOKEN}')
+    return (request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+            and not any(header in request.META
+                        for header in PROXY_HEADERS))
+
+
+def metrics(request):
+    if not allowed_to_scrape(request):
+        raise Http404
+    collect_metrics.send(sender=registry.__class__, registry=registry)
+    return HttpResponse(registry.export(),
+                        content_type='text/plain; version=0.0.4; '
+                                     'charset=utf-8')
+
+
+class InstrumentedTemplate:
+    """Шаблон бэкенда, замеряющий свою отрисовку."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        stats = current_stats()
+        if stats is None or stats.rendering:
+            return self.template.render(context, request)
+        stats.rendering = True
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - started
+            stats.rendering = False
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """Бэкенд шаблонов Django с замером времени отрисовки."""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super().get_template(template_name))
+
+
+_missing = object()
+
+
+class CacheMetricsMixin:
+    """Считает попадания и промахи get и get_many бэкенда кэша."""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _missing, version)
+        stats = current_stats()
+        if stats is not None and not stats.reading_many:
+            if value is _missing:
+                stats.cache_misses += 1
+            else:
+                stats.cache_hits += 1
+        return default if value is _missing else value
+
+    def get_many(self, keys, version=None):
+        stats = current_stats()
+        if stats is None:
+            return super().get_many(keys, version)
+        keys = list(keys)
+        stats.reading_many = True
+        try:
+            found = super().get_many(keys, version)
+        finally:
+            stats.reading_many = False
+        stats.cache_hits += len(found)
+        stats.cache_misses += len(keys) - len(found)
+        return found
+
+
+class InstrumentedLocMemCache(CacheMetricsMixin, LocMemCache):
+    pass
+
+
+class InstrumentedSQLiteCache(CacheMetricsMixin, SQLiteCache):
+    pass
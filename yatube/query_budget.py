@@ -0,0 +1,39 @@
+"""
+Плагин pytest: тест падает, если ответ представления сделал больше
+запросов к базе, чем указано для него в QUERY_BUDGETS, или повторил
+запрос одной формы N_PLUS_ONE_THRESHOLD раз (N+1, yatube.querylog).
+
+Подключается в pytest.ini: ``addopts = -p yatube.query_budget``.
+На время теста замеряются все запросы (METRICS_SAMPLE_RATE = 1).
+"""
+import pytest
+
+DISPATCH_UID = 'yatube.query_budget'
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    # Django импортируется здесь: при загрузке плагина настройки ещё не
+    # прочитаны
+    from django.test import override_settings
+    from yatube.metrics import request_measured
+    from yatube.querylog import budget_violations
+
+    problems = []
+
+    def check(sender, view, stats, **kwargs):
+        problems.extend(budget_violations(view, stats))
+
+    request_measured.connect(check, weak=False, dispatch_uid=DISPATCH_UID)
+    try:
+        with override_settings(METRICS_SAMPLE_RATE=1):
+            outcome = yield
+    finally:
+        request_measured.disconnect(dispatch_uid=DISPATCH_UID)
+    if problems and outcome.excinfo is None:
+        error = pytest.fail.Exception('\n'.join(problems), pytrace=False)
+        if hasattr(outcome, 'force_exception'):
+            # pluggy >= 1.1: исключение из обёртки больше не бросают
+            outcome.force_exception(error)
+        else:
+            raise error
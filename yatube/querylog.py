@@ -0,0 +1,129 @@
+"""
+Поиск N+1 и медленных запросов к базе.
+
+Для замеряемых запросов (yatube.metrics) каждый SQL сводится к форме:
+литералы и параметры заменяются на ``?``, списки ``IN (...)`` любой
+длины — на один. Если одна форма повторилась за ответ
+N_PLUS_ONE_THRESHOLD раз, это почти всегда ленивая загрузка связи в
+цикле (N+1). Запросы дольше SLOW_QUERY_SECONDS отмечаются отдельно.
+Для каждой находки запоминается строка кода проекта и строка шаблона,
+из которых ушёл запрос, и всё пишется в журнал ``yatube.queries``.
+
+В тестах то же самое проверяет плагин pytest yatube.query_budget,
+добавляя к этому лимиты QUERY_BUDGETS на число запросов представления.
+"""
+import logging
+import os
+import re
+import sys
+
+from django.conf import settings
+from django.template.base import Node
+
+logger = logging.getLogger('yatube.queries')
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER_RE = re.compile(r'%s|\?')
+IN_LIST_RE = re.compile(r'\bIN \(\?(?:, \?)*\)', re.IGNORECASE)
+SPACE_RE = re.compile(r'\s+')
+# Управление транзакциями повторяется законно и в N+1 не считается
+TRANSACTION_RE = re.compile(r'(BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE)\b',
+                            re.IGNORECASE)
+
+# Кадр отрисовки узла шаблона: в нём виден шаблон и номер строки
+_RENDER_NODE_CODE = Node.render_annotated.__code__
+# Кадры этих файлов — сам замер, а не виновник запроса
+_OWN_FILES = {__file__,
+              os.path.join(os.path.dirname(__file__), 'metrics.py')}
+
+
+def fingerprint(sql):
+    """Форма запроса без конкретных значений."""
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = PLACEHOLDER_RE.sub('?', sql)
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    return SPACE_RE.sub(' ', sql).strip()
+
+
+def caller_location():
+    """
+    Строка кода проекта и строка шаблона, ближайшие к запросу, например
+    ``posts/views.py:30; includes/post_item.html:12``.
+    """
+    code = template = None
+    frame = sys._getframe(1)
+    while frame is not None and (code is None or template is None):
+        if template is None and frame.f_code is _RENDER_NODE_CODE:
+            node = frame.f_locals['self']
+            origin = getattr(node, 'origin', None)
+            token = getattr(node, 'token', None)
+            if origin is not None and token is not None:
+                name = origin.template_name or origin.name
+                template = f'{name}:{token.lineno}'
+        filename = frame.f_code.co_filename
+        if (code is None and filename.startswith(settings.BASE_DIR)
+                and 'site-packages' not in filename
+                and filename not in _OWN_FILES):
+            code = (f'{os.path.relpath(filename, settings.BASE_DIR)}:'
+                    f'{frame.f_lineno}')
+        frame = frame.f_back
+    return '; '.join(place for place in (code, template) if place)
+
+
+class QueryLog:
+    """Формы запросов одного ответа."""
+
+    def __init__(self):
+        # Форма -> {'sql', 'count', 'time', 'location'}
+        self.shapes = {}
+        self.slow = []
+
+    def add(self, sql, duration):
+        shape = fingerprint(sql)
+        entry = self.shapes.get(shape)
+        if entry is None:
+            # Место ищется только для первого запроса формы: обход стека
+            # дороже самого учёта
+            entry = self.shapes[shape] = {
+                'sql': sql, 'count': 0, 'time': 0,
+                'location': caller_location(),
+            }
+        entry['count'] += 1
+        entry['time'] += duration
+        if duration >= settings.SLOW_QUERY_SECONDS:
+            self.slow.append({'sql': sql, 'time': duration,
+                              'location': caller_location()})
+
+    def repeated(self):
+        """Формы, повторённые не меньше N_PLUS_ONE_THRESHOLD раз."""
+        return [entry for entry in self.shapes.values()
+                if entry['count'] >= settings.N_PLUS_ONE_THRESHOLD
+                and not TRANSACTION_RE.match(entry['sql'])]
+
+
+def check_queries(view, query_log):
+    """Пишет в журнал N+1 и медленные запросы; возвращает их."""
+    repeated = query_log.repeated()
+    for entry in repeated:
+        logger.warning('N+1 в %s: %s одинаковых запросов (%s): %s',
+                       view, entry['count'], entry['location'], entry['sql'])
+    for entry in query_log.slow:
+        logger.warning('Медленный запрос в %s: %.0f мс (%s): %s',
+                       view, entry['time'] * 1000, entry['location'],
+                       entry['sql'])
+    return repeated, query_log.slow
+
+
+def budget_violations(view, stats):
+    """Сообщения о превышении лимита запросов и о N+1 для тестов."""
+    problems = []
+    budget = settings.QUERY_BUDGETS.get(view)
+    if budget is not None and stats.queries > budget:
+        problems.append(f'{view}: {stats.queries} запросов к базе '
+                        f'при лимите {budget}')
+    for entry in stats.query_log.repeated():
+        problems.append(f'{view}: N+1, {entry["count"]} одинаковых '
+                        f'запросов ({entry["location"]}): {entry["sql"]}')
+    return problems
@@ -0,0 +1,100 @@
+"""
+Чтение с реплик, запись в основную базу.
+
+Псевдонимы реплик перечислены в DATABASE_REPLICAS. Пока список пуст,
+роутер ничего не решает и всё идёт в ``default``.
+
+Реплика отстаёт от основной базы, поэтому пользователь, который только
+что писал, должен видеть свои изменения (read-your-writes). Для этого
+PrimaryPinningMiddleware после любого изменяющего запроса ставит cookie
+на DATABASE_PIN_SECONDS. Представления, которые пишут в ответ на GET
+(ссылки подписки и отписки), отмечаются декоратором ``pins_primary``.
+Пока cookie жива, все запросы этого пользователя читают основную базу,
+как и любой код внутри открытой транзакции основной базы. Фоновые
+задачи, которые читают только что записанное, оборачиваются
+в ``use_primary()``.
+
+Для локальной проверки реплики — это отдельные файлы SQLite, которые
+команда ``sync_replicas`` заполняет копией основной базы.
+"""
+import random
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+PRIMARY = 'default'
+PIN_COOKIE = 'pin_primary'
+# Приложения, которые всегда читаются из основной базы: сессия нужна
+# сразу после входа, а её чтение — один запрос по ключу
+PRIMARY_ONLY_APPS = {'sessions'}
+
+_state = threading.local()
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', 0) > 0
+
+
+@contextmanager
+def use_primary():
+    """Внутри блока все чтения идут в основную базу."""
+    _state.pinned = getattr(_state, 'pinned', 0) + 1
+    try:
+        yield
+    finally:
+        _state.pinned -= 1
+
+
+def pins_primary(view):
+    """Представление пишет данные, даже если вызвано через GET."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.writes_data = True
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if (not replicas or is_pinned()
+                or model._meta.app_label in PRIMARY_ONLY_APPS
+                # Внутри транзакции записи читаем то, что в ней изменено
+                or connections[PRIMARY].in_atomic_block):
+            return PRIMARY
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Во всех базах одни и те же данные
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return True
+
+
+class PrimaryPinningMiddleware:
+    """Закрепляет за пользователем основную базу после записи."""
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        writes = request.method not in self.SAFE_METHODS
+        if writes or request.COOKIES.get(PIN_COOKIE):
+            with use_primary():
+                response = self.get_response(request)
+        else:
+            response = self.get_response(request)
+        writes = writes or getattr(request, 'writes_data', False)
+        if writes and response.status_code < 400:
+            response.set_cookie(PIN_COOKIE, '1',
+                                max_age=settings.DATABASE_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
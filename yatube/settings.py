@@ -42,29 +42,63 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'sorl.thumbnail',
-    'debug_toolbar',
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы замер включал запросы сессий и пользователя
+    'yatube.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'yatube.routers.PrimaryPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
 INTERNAL_IPS = [
     "127.0.0.1",
 ]
 
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
+# Метрики производительности (yatube.metrics): доля замеряемых запросов
+# и доступ к /metrics. За обратным прокси задайте YATUBE_METRICS_TOKEN:
+# без токена метрики отдаются только прямым запросам с этих адресов
+METRICS_SAMPLE_RATE = 1.0 if DEBUG else 0.05
+METRICS_TOKEN = os.environ.get('YATUBE_METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = ['127.0.0.1']
+# Поиск N+1 и медленных запросов (yatube.querylog): сколько повторов
+# одной формы запроса за ответ считать N+1 и какой запрос медленный
+N_PLUS_ONE_THRESHOLD = 5
+SLOW_QUERY_SECONDS = 0.1
+# Лимиты числа запросов к базе по имени представления; превышение
+# роняет тест pytest (плагин yatube.query_budget)
+QUERY_BUDGETS = {
+    'posts:index:index': 5,
+    'posts:index:blogs': 6,
+    'posts:index:profile': 7,
+    'posts:index:post': 7,
+    'posts:index:post_comments': 6,
+    'posts:index:follow_index': 8,
+    'posts:index:search': 8,
+    'posts:index:new_post': 20,
+    'posts:index:post_edit': 14,
+    'posts:index:add_comment': 9,
+    'posts:index:profile_follow': 20,
+    'posts:index:profile_unfollow': 11,
+}
+
 ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'yatube.metrics.InstrumentedDjangoTemplates',
+        # Имя по умолчанию взялось бы из пути бэкенда ('metrics')
+        'NAME': 'django',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -87,7 +121,40 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Сколько секунд ждать освобождения блокировки записи
+        'OPTIONS': {'timeout': 20},
+        # Соединение переиспользуется между запросами воркера
+        'CONN_MAX_AGE': 0 if DEBUG else 600,
+    }
+}
+
+# Реплики только для чтения (yatube.routers). Локально их заменяют
+# копии db.sqlite3: YATUBE_DB_REPLICAS=2 добавит db-replica1.sqlite3
+# и db-replica2.sqlite3, заполняет их команда sync_replicas
+DATABASE_REPLICAS = []
+for number in range(1, int(os.environ.get('YATUBE_DB_REPLICAS', 0)) + 1):
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME': os.path.join(BASE_DIR, f'db-{alias}.sqlite3'),
+        # В тестах реплика — та же тестовая база
+        'TEST': {'MIRROR': 'default'},
     }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['yatube.routers.PrimaryReplicaRouter']
+# Сколько секунд после записи пользователь читает основную базу
+DATABASE_PIN_SECONDS = 15
+
+# Применяются к каждому новому соединению (yatube.db.configure_sqlite)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    # 64 МиБ кэша страниц (отрицательное значение — в килобайтах)
+    'cache_size': -64 * 1024,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
 }
 
 # Password validation
@@ -141,12 +208,87 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 # Paginator setup
 RECORDS_ON_THE_PAGE = 10
+COMMENTS_ON_THE_PAGE = 20
 
 # Идентификатор текущего сайта
 SITE_ID = 1
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'yatube.metrics.InstrumentedLocMemCache',
     }
 }
+
+if not DEBUG:
+    # Общий для всех воркеров кэш в файле SQLite: не нужен отдельный
+    # сервис, а кэши лент и карточек не прогреваются в каждом процессе
+    CACHES = {
+        'default': {
+            'BACKEND': 'yatube.metrics.InstrumentedSQLiteCache',
+            'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+            'OPTIONS': {
+                'MAX_ENTRIES': 100000,
+                'CULL_FREQUENCY': 4,
+            },
+        }
+    }
+
+# Лента подписок (follow_index)
+# Авторы с бОльшим числом подписчиков не раскладываются по лентам при
+# публикации, их записи подмешиваются при чтении
+TIMELINE_FANOUT_MAX_FOLLOWERS = 1000
+# Сколько последних записей автора попадает в ленту при подписке
+TIMELINE_BACKFILL = 200
+
+# Страницы лент в кэше; устаревают сразу при изменении записей
+FEED_CACHE_TIMEOUT = 60 * 60
+# Аренда пересборки устаревшей страницы одним запросом, секунды, и
+# сколько ждать чужой пересборки, если прежней копии нет
+FEED_REBUILD_LEASE = 10
+FEED_REBUILD_WAIT = 2
+# Идентификатор выкладки: входит в ETag страниц, чтобы после смены
+# шаблонов браузеры не получали 304 на страницы в прежнем оформлении
+RELEASE = os.environ.get('YATUBE_RELEASE', '')
+
+# Прогрев кэша лент (posts.warmup, команда warm_cache): первые страницы
+# главной, популярных сообществ и профилей, собираемые в пуле потоков.
+# YATUBE_WARM_CACHE=1 прогревает кэш при запуске каждого воркера WSGI
+CACHE_WARMUP_PAGES = 3
+CACHE_WARMUP_GROUPS = 10
+CACHE_WARMUP_PROFILES = 10
+CACHE_WARMUP_WORKERS = 4
+CACHE_WARMUP_ON_START = bool(os.environ.get('YATUBE_WARM_CACHE'))
+# Имя сайта в запросах прогрева; по умолчанию первое явное из ALLOWED_HOSTS
+CACHE_WARMUP_HOST = os.environ.get('YATUBE_WARMUP_HOST', '')
+# Число записей ленты (posts.counting): до предела считается точно,
+# больше — оценка из кэша, обновляемая раз в FEED_COUNT_TIMEOUT секунд
+FEED_COUNT_EXACT_LIMIT = 1000
+FEED_COUNT_TIMEOUT = 5 * 60
+
+# Миниатюры картинок записей для srcset: ширины и форматы.
+# Первый формат предпочтительный, последний — запасной для <img src>
+POST_IMAGE_WIDTHS = (480, 960, 1440)
+POST_IMAGE_FORMATS = ('WEBP', 'JPEG')
+POST_IMAGE_ASPECT_RATIO = 339 / 960
+POST_IMAGE_DEFAULT_WIDTH = 960
+# Имя -> (геометрия, параметры sorl-thumbnail)
+POST_IMAGE_RENDITIONS = {
+    f'card-{width}-{image_format.lower()}': (
+        f'{width}x{round(width * POST_IMAGE_ASPECT_RATIO)}',
+        {'crop': 'center', 'upscale': True, 'format': image_format},
+    )
+    for width in POST_IMAGE_WIDTHS
+    for image_format in POST_IMAGE_FORMATS
+}
+
+# Фоновая очередь задач (posts.tasks, команда run_tasks). В режиме
+# разработки задачи выполняются сразу при постановке
+TASKS_EAGER = DEBUG
+# Попыток до состояния failed; пауза перед повтором удваивается
+TASK_MAX_ATTEMPTS = 5
+TASK_RETRY_DELAY = 10
+# Через сколько секунд взятая и не завершённая задача выдаётся снова
+TASK_LEASE = 5 * 60
+
+# Замеры производительности (benchmark_views) с коммитом каждого замера
+BENCHMARK_RESULTS_FILE = os.path.join(BASE_DIR, 'benchmarks', 'results.jsonl')
@@ -0,0 +1,244 @@
+"""
+Кэш в файле SQLite, общий для всех процессов на одной машине.
+
+LocMemCache у каждого воркера свой, и при росте числа воркеров попадания
+в кэш падают. Этот бэкенд хранит данные в одном файле в режиме WAL:
+чтения не блокируют друг друга, а incr выполняется в транзакции
+BEGIN IMMEDIATE и поэтому атомарен между процессами.
+
+Настройка::
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'yatube.sqlite_cache.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube-cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 100000, 'CULL_FREQUENCY': 4},
+        }
+    }
+
+При переполнении сначала удаляются просроченные записи, затем давно
+не читавшиеся (приближённый LRU: время чтения обновляется не чаще
+раза в ACCESS_RESOLUTION секунд, чтобы чтение не превращалось в запись).
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY,'
+    ' value BLOB NOT NULL,'
+    ' expires REAL,'
+    ' accessed REAL NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+)
+
+
+class SQLiteCache(BaseCache):
+    # Как часто (в записях) проверять размер кэша
+    CULL_CHECK_INTERVAL = 64
+    # Точность времени последнего чтения для вытеснения, секунды
+    ACCESS_RESOLUTION = 60
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        options = params.get('OPTIONS', {})
+        self._busy_timeout = options.get('BUSY_TIMEOUT', 5)
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self._path,
+                timeout=self._busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _expires(self, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        return None if timeout is None else float(timeout)
+
+    @staticmethod
+    def _dumps(value):
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _after_write(self):
+        with self._lock:
+            self._writes += 1
+            check = self._writes % self.CULL_CHECK_INTERVAL == 0
+        if check:
+            self._cull()
+
+    def _cull(self):
+        connection = self._connection
+        now = time.time()
+        connection.execute(
+            'DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?',
+            (now,))
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            connection.execute('DELETE FROM cache')
+            return
+        keep = self._max_entries - self._max_entries // self._cull_frequency
+        connection.execute(
+            'DELETE FROM cache WHERE key IN ('
+            ' SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+            (count - keep,))
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        row = self._connection.execute(
+            'SELECT value, expires, accessed FROM cache WHERE key = ?',
+            (key,)).fetchone()
+        if row is None:
+            return default
+        value, expires, accessed = row
+        now = time.time()
+        if expires is not None and expires <= now:
+            self._connection.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, now))
+            return default
+        if now - accessed > self.ACCESS_RESOLUTION:
+            self._connection.execute(
+                'UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+        return pickle.loads(value)
+
+    def get_many(self, keys, version=None):
+        made = {self._key(key, version): key for key in keys}
+        if not made:
+            return {}
+        now = time.time()
+        placeholders = ','.join('?' * len(made))
+        rows = self._connection.execute(
+            f'SELECT key, value FROM cache WHERE key IN ({placeholders})'
+            ' AND (expires IS NULL OR expires > ?)',
+            (*made, now)).fetchall()
+        return {made[key]: pickle.loads(value) for key, value in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        self._connection.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires, accessed) '
+            'VALUES (?, ?, ?, ?)',
+            (key, self._dumps(value), self._expires(timeout), time.time()))
+        self._after_write()
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self._expires(timeout)
+        now = time.time()
+        rows = [(self._key(key, version), self._dumps(value), expires, now)
+                for key, value in data.items()]
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, expires, accessed) '
+                'VALUES (?, ?, ?, ?)', rows)
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        self._after_write()
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, now))
+            added = connection.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires, accessed) '
+                'VALUES (?, ?, ?, ?)',
+                (key, self._dumps(value), self._expires(timeout), now)
+            ).rowcount == 1
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        if added:
+            self._after_write()
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        connection = self._connection
+        # IMMEDIATE сразу берёт блокировку записи: чтение и запись
+        # значения не перемешаются с другими процессами
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ?'
+                ' AND (expires IS NULL OR expires > ?)',
+                (key, time.time())).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            new_value = pickle.loads(row[0]) + delta
+            connection.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                (self._dumps(new_value), key))
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return new_value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        return self._connection.execute(
+            'UPDATE cache SET expires = ? WHERE key = ?'
+            ' AND (expires IS NULL OR expires > ?)',
+            (self._expires(timeout), key, time.time())).rowcount == 1
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return self._connection.execute(
+            'SELECT 1 FROM cache WHERE key = ?'
+            ' AND (expires IS NULL OR expires > ?)',
+            (key, time.time())).fetchone() is not None
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        self._connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def delete_many(self, keys, version=None):
+        made = [self._key(key, version) for key in keys]
+        if made:
+            placeholders = ','.join('?' * len(made))
+            self._connection.execute(
+                f'DELETE FROM cache WHERE key IN ({placeholders})', made)
+
+    def clear(self):
+        self._connection.execute('DELETE FROM cache')
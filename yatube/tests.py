@@ -0,0 +1,282 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.template import engines
+from django.test import (Client, RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.urls import reverse
+from posts.models import Post, User
+from yatube.db import get_pragmas
+from yatube.metrics import MetricsMiddleware, registry, request_measured
+from yatube.querylog import budget_violations, fingerprint
+from yatube.routers import (PIN_COOKIE, PRIMARY, PrimaryPinningMiddleware,
+                            PrimaryReplicaRouter, is_pinned, pins_primary,
+                            use_primary)
+from yatube.sqlite_cache import SQLiteCache
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'cache.sqlite3')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.location, {'OPTIONS': options})
+
+    def test_values_are_shared_between_instances(self):
+        """Значения видны другому экземпляру, как другому процессу"""
+        first, second = self.make_cache(), self.make_cache()
+        first.set('key', {'value': 1})
+        self.assertEqual(second.get('key'), {'value': 1})
+        self.assertEqual(second.get_many(['key', 'missing']),
+                         {'key': {'value': 1}})
+        second.delete('key')
+        self.assertIsNone(first.get('key'))
+
+    def test_add_and_expiration(self):
+        """add не перезаписывает значение, просроченное не отдаётся"""
+        cache = self.make_cache()
+        self.assertTrue(cache.add('key', 1))
+        self.assertFalse(cache.add('key', 2))
+        self.assertEqual(cache.get('key'), 1)
+        cache.set('key', 3, timeout=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('key'))
+        self.assertTrue(cache.add('key', 4))
+
+    def test_incr_is_atomic(self):
+        """Параллельные incr не теряют приращений"""
+        self.make_cache().set('counter', 0, timeout=None)
+
+        def increment():
+            cache = self.make_cache()
+            for _ in range(50):
+                cache.incr('counter')
+
+        threads = [threading.Thread(target=increment) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.make_cache().get('counter'), 200)
+        with self.assertRaises(ValueError):
+            self.make_cache().incr('missing')
+
+    def test_size_is_bounded(self):
+        """При переполнении вытесняются давно не читавшиеся записи"""
+        cache = self.make_cache(MAX_ENTRIES=10, CULL_FREQUENCY=2)
+        cache.CULL_CHECK_INTERVAL = 1
+        for number in range(30):
+            cache.set(f'key-{number}', number)
+        stored = sum(cache.has_key(f'key-{number}') for number in range(30))
+        self.assertLessEqual(stored, 10)
+        self.assertTrue(cache.has_key('key-29'))
+
+
+class SQLitePragmaTests(TestCase):
+    def test_connection_is_tuned(self):
+        """Новое соединение получает PRAGMA из SQLITE_PRAGMAS"""
+        if connection.vendor != 'sqlite':
+            self.skipTest('Только для SQLite')
+        # journal_mode у базы в памяти всегда memory, его не проверяем
+        pragmas = get_pragmas(
+            connection, ['synchronous', 'busy_timeout', 'cache_size'])
+        self.assertEqual(pragmas, {
+            'synchronous': 1,
+            'busy_timeout': 20000,
+            'cache_size': -64 * 1024,
+        })
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+
+    def test_reads_go_to_replicas_writes_to_primary(self):
+        """Чтение уходит на реплики, запись — в основную базу"""
+        self.assertIn(self.router.db_for_read(Post), ['replica1', 'replica2'])
+        self.assertEqual(self.router.db_for_write(Post), PRIMARY)
+        # Сессии всегда читаются из основной базы
+        self.assertEqual(self.router.db_for_read(Session), PRIMARY)
+        with use_primary():
+            self.assertEqual(self.router.db_for_read(Post), PRIMARY)
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(self.router.db_for_read(Post), PRIMARY)
+
+    def test_writing_request_pins_user_to_primary(self):
+        """После записи пользователь какое-то время читает основную базу"""
+        seen = []
+
+        def view(request):
+            seen.append(is_pinned())
+            return HttpResponse()
+
+        middleware = PrimaryPinningMiddleware(view)
+        factory = RequestFactory()
+        response = middleware(factory.get('/'))
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        response = middleware(factory.post('/new/'))
+        self.assertIn(PIN_COOKIE, response.cookies)
+        request = factory.get('/')
+        request.COOKIES[PIN_COOKIE] = response.cookies[PIN_COOKIE].value
+        middleware(request)
+        self.assertEqual(seen, [False, True, True])
+        self.assertFalse(is_pinned())
+
+    def test_view_writing_on_get_pins_user(self):
+        """Запись по ссылке (GET) тоже закрепляет основную базу"""
+        middleware = PrimaryPinningMiddleware(
+            pins_primary(lambda request: HttpResponse()))
+        response = middleware(RequestFactory().get('/author/follow/'))
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+
+@override_settings(METRICS_SAMPLE_RATE=1)
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        author = User.objects.create(username='testauthor')
+        Post.objects.create(text='Тестовая запись', author=author)
+
+    def setUp(self):
+        cache.clear()
+        registry.clear()
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        return dict(line.rsplit(' ', 1)
+                    for line in response.content.decode().splitlines()
+                    if not line.startswith('#'))
+
+    def test_request_is_measured(self):
+        """Время, запросы к базе, отрисовка и кэш собираются по view"""
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        metrics = self.scrape()
+        view = '{view="posts:index:index"}'
+        self.assertEqual(
+            metrics['yatube_request_duration_seconds_count' + view], '2')
+        self.assertGreater(
+            float(metrics['yatube_db_queries_sum' + view]), 0)
+        self.assertGreater(
+            float(metrics['yatube_db_duration_seconds_sum' + view]), 0)
+        self.assertGreater(
+            float(metrics['yatube_template_duration_seconds_sum' + view]), 0)
+        self.assertEqual(metrics['yatube_db_queries_bucket'
+                                 '{view="posts:index:index",le="+Inf"}'],
+                         '2')
+        # Вторая страница отдана из кэша
+        self.assertGreater(int(metrics['yatube_cache_requests_total'
+                                       '{result="hit",view="posts:index:'
+                                       'index"}']), 0)
+        self.assertEqual(metrics['yatube_responses_total'
+                                 '{status="200",view="posts:index:index"}'],
+                         '2')
+        # Сам /metrics не замеряется
+        self.assertFalse(any('view="metrics"' in key for key in metrics))
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_skipped(self):
+        """Незамеряемые запросы не попадают в метрики"""
+        self.client.get(reverse('posts:index'))
+        self.assertFalse(any('view=' in key for key in self.scrape()))
+
+    def test_endpoint_is_limited_to_allowed_ips(self):
+        """Метрики отдаются только разрешённым адресам"""
+        response = Client(REMOTE_ADDR='192.0.2.1').get(reverse('metrics'))
+        self.assertEqual(response.status_code, 404)
+        # Запрос извне через прокси приходит с его адреса
+        response = self.client.get(reverse('metrics'),
+                                   HTTP_X_FORWARDED_FOR='198.51.100.7')
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_endpoint_requires_token_when_set(self):
+        """С токеном метрики отдаются только по нему"""
+        self.assertEqual(self.client.get(reverse('metrics')).status_code,
+                         404)
+        response = Client(REMOTE_ADDR='192.0.2.1').get(
+            reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(METRICS_SAMPLE_RATE=1, N_PLUS_ONE_THRESHOLD=5)
+class QueryLogTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        author = User.objects.create(username='testauthor')
+        Post.objects.bulk_create(
+            Post(text=f'Запись {number}', author=author)
+            for number in range(5)
+        )
+
+    def measure(self, view):
+        measured = []
+
+        def receiver(sender, stats, **kwargs):
+            measured.append(stats)
+
+        request_measured.connect(receiver)
+        try:
+            MetricsMiddleware(view)(RequestFactory().get('/'))
+        finally:
+            request_measured.disconnect(receiver)
+        return measured[0]
+
+    def test_fingerprint_ignores_values(self):
+        """Запросы, отличающиеся только значениями, одной формы"""
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s) '
+                        "AND name = 'x' LIMIT 10"),
+            fingerprint('SELECT * FROM t WHERE id IN (%s)  '
+                        "AND name = 'it''s' LIMIT 20"),
+        )
+
+    def test_lazy_loads_in_template_are_reported(self):
+        """N+1 в шаблоне находится вместе с местом в коде и шаблоне"""
+        template = engines['django'].from_string(
+            '{% for post in posts %}\n{{ post.author.username }}'
+            '{% endfor %}')
+
+        def view(request):
+            return HttpResponse(template.render(
+                {'posts': Post.objects.all()}))
+
+        with self.assertLogs('yatube.queries', 'WARNING') as logs:
+            stats = self.measure(view)
+        message, = logs.output
+        self.assertIn('N+1', message)
+        self.assertIn('5 одинаковых', message)
+        self.assertIn('yatube/tests.py', message)
+        self.assertIn(':2', message)
+        self.assertTrue(budget_violations('unresolved', stats))
+
+    @override_settings(QUERY_BUDGETS={'unresolved': 1})
+    def test_budget_and_slow_queries(self):
+        """Превышение лимита и медленные запросы отмечаются"""
+        def view(request):
+            list(Post.objects.all())
+            list(User.objects.all())
+            return HttpResponse()
+
+        with override_settings(SLOW_QUERY_SECONDS=0):
+            with self.assertLogs('yatube.queries', 'WARNING') as logs:
+                stats = self.measure(view)
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn('Медленный запрос', logs.output[0])
+        violation, = budget_violations('unresolved', stats)
+        self.assertIn('2 запросов к базе при лимите 1', violation)
@@ -20,6 +20,8 @@ from django.contrib import admin
 from django.contrib.flatpages import views
 from django.urls import include, path
 
+from .metrics import metrics
+
 handler404 = "posts.views.page_not_found"  # noqa
 handler500 = "posts.views.server_error"  # noqa
 
@@ -35,6 +37,7 @@ urlpatterns = [
          name='about-author'),
     path('auth/', include('django.contrib.auth.urls')),
     path('admin/', admin.site.urls),
+    path('metrics', metrics, name='metrics'),
     path('', include(('posts.urls', 'posts'), namespace='posts:index')),
 ]
 
@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.CACHE_WARMUP_ON_START:
+    # Кэш нового воркера пуст: прогреваем его, не задерживая запуск
+    from posts.warmup import warm_in_background
+    warm_in_background()